@@ -0,0 +1,109 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Push a message when a subscribed favourite's value changes.
+
+Nothing polls: the folder watcher reports a new file version, and only then are
+that workbook's subscribed cells re-read (one read per sheet, shared by every
+subscriber) and compared with the value each user last saw.
+"""
+
+from __future__ import annotations
+import asyncio
+import html
+from pathlib import Path
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+from telegram.ext import Application, ContextTypes
+
+from .cache import FileVersion
+from .database import aget_subscriptions, aset_subscribed, aupdate_last_values
+from .executor import read_cells
+from .watcher import folder_watcher
+
+def stored(value) -> str:
+    """How a value is kept in favourites.last_value (and compared)."""
+    return "" if value is None else str(value)
+
+# One check per workbook at a time, so two quick saves can't both report the same change.
+# A check waiting behind a running one also covers any saves made while it waits.
+_locks: dict[str, asyncio.Lock] = {}
+_waiting: set[str] = set()
+
+async def check_file(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job: re-read the subscribed cells of one changed workbook and notify on differences."""
+    file_path: str = context.job.data
+    if file_path in _waiting:
+        return
+    _waiting.add(file_path)
+    try:
+        async with _locks.setdefault(file_path, asyncio.Lock()):
+            _waiting.discard(file_path)
+            await _check(context, file_path)
+    finally:
+        _waiting.discard(file_path)
+
+async def _check(context: ContextTypes.DEFAULT_TYPE, file_path: str) -> None:
+    # Read only now: the last values are those left by the previous check
+    subs = await aget_subscriptions(file_path)
+    if not subs:
+        return
+    by_sheet: dict[str, set[str]] = {}
+    for _id, _uid, _nick, sheet_name, cell_coord, _last in subs:
+        by_sheet.setdefault(sheet_name, set()).add(cell_coord.upper())
+
+    current: dict[tuple[str, str], str] = {}
+    for sheet_name, coords in by_sheet.items():
+        ordered = sorted(coords)
+        try:
+            values = await read_cells(Path(file_path), sheet_name, ordered)
+        except Exception:  # noqa: BLE001
+            # Sheet renamed or file mid-write; the next version event will retry
+            continue
+        current.update({(sheet_name, c): stored(v) for c, v in zip(ordered, values)})
+
+    changes: list[tuple[str, int]] = []
+    for fav_id, user_id, nickname, sheet_name, cell_coord, last_value in subs:
+        new = current.get((sheet_name, cell_coord.upper()))
+        if new is None or new == last_value:
+            continue
+        try:
+            await context.bot.send_message(
+                user_id,
+                f"🔔 <b>{html.escape(nickname)}</b> ({html.escape(f'{sheet_name}!{cell_coord}')}) changed: "
+                f"{html.escape(last_value or '—')} → {html.escape(new)}",
+                parse_mode="HTML",
+            )
+        except Forbidden:
+            # The user blocked the bot: stop alerting them about this cell
+            await aset_subscribed(user_id, fav_id, False)
+            continue
+        except BadRequest:
+            pass  # the message itself is rejected, so resending it can't help: move on to the new value
+        except TelegramError:
+            continue  # keep the old value so the change is reported next time
+        changes.append((new, fav_id))
+    if changes:
+        await aupdate_last_values(changes)
+
+def install(app: Application) -> None:
+    """Check subscriptions whenever a workbook in EXCEL_FOLDER gets a new version."""
+    def on_change(path: Path, version: FileVersion | None) -> None:
+        # Called from the watcher thread; the job queue is safe to use from there
+        if version is not None:
+            app.job_queue.run_once(check_file, when=0, data=str(path), name=f"alerts:{path.name}")
+
+    folder_watcher.add_listener(on_change)
@@ -0,0 +1,144 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""In-memory prefix indexes behind inline mode (`@bot tot…`).
+
+Inline queries arrive on every keystroke, so they are answered from memory: a
+trie of each user's favourite nicknames (loaded from the database once, dropped
+when the user saves a favourite) and one of every sheet in the folder, indexed
+by file and sheet name words (rebuilt when the folder snapshot changes).
+"""
+
+from __future__ import annotations
+import re
+from typing import Any
+
+from .cache import LRUCache
+from .config import STATE_MAX_SESSIONS
+from .database import aget_favourites
+from .watcher import folder_watcher
+from . import metrics
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+def words(text: str) -> list[str]:
+    """Lower-cased words; underscores and punctuation separate them (sales_q3.xlsx -> sales, q3, xlsx)."""
+    return _WORD_RE.findall(text.casefold())
+
+class PrefixIndex:
+    """Items found by word prefixes of their labels.
+
+    A query matches an item when every query word starts some word of its label,
+    so "tot q3" finds "Q3 totals". Results keep insertion order.
+    """
+
+    __slots__ = ("_root", "_items")
+
+    # Key of the item ids stored at a node; every other key is a single character
+    _IDS = ""
+
+    def __init__(self) -> None:
+        self._root: dict[str, Any] = {}
+        self._items: list[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: Any, label: str) -> None:
+        item_id = len(self._items)
+        self._items.append(item)
+        for word in set(words(label)):
+            node = self._root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node.setdefault(self._IDS, []).append(item_id)
+
+    def _under(self, prefix: str) -> set[int]:
+        node = self._root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return set()
+        ids: set[int] = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == self._IDS:
+                    ids.update(child)
+                else:
+                    stack.append(child)
+        return ids
+
+    def find(self, query: str, limit: int) -> list[Any]:
+        """Items matching every word of `query`; an empty query returns the first `limit` items."""
+        query_words = set(words(query))
+        if not query_words:
+            return self._items[:limit]
+        matches: set[int] | None = None
+        # Longer prefixes have smaller subtrees: start there to keep the intersection small
+        for word in sorted(query_words, key=len, reverse=True):
+            ids = self._under(word)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+        return [self._items[i] for i in sorted(matches)[:limit]]
+
+# ---------- Favourites (per user) ----------
+
+_favourites = LRUCache(STATE_MAX_SESSIONS)
+metrics.register_cache("autocomplete", _favourites)
+# Bumped on every change, so a load that raced with one isn't cached
+_changes = 0
+
+async def favourite_index(user_id: int) -> PrefixIndex:
+    """The user's favourites, (id, nickname, file_path, sheet_name, cell_coord), by nickname."""
+    index = _favourites.get(user_id)
+    if index is None:
+        seen = _changes
+        index = PrefixIndex()
+        for fav in await aget_favourites(user_id):
+            index.add(fav, fav[1])
+        if seen == _changes:
+            _favourites.put(user_id, index)
+    return index
+
+def favourites_changed(user_id: int) -> None:
+    """Call after changing a user's favourites; their index is rebuilt on the next query."""
+    global _changes
+    _changes += 1
+    _favourites.pop(user_id)
+
+# ---------- Sheets (whole folder) ----------
+
+# (snapshot version, index of (path, sheet name))
+_sheets: tuple[int, PrefixIndex] = (-1, PrefixIndex())
+
+def sheet_index() -> PrefixIndex:
+    """Every known sheet as (path, sheet name), by the words of its file and sheet names."""
+    global _sheets
+    snap = folder_watcher.snapshot()
+    if snap is not None and snap.version != _sheets[0]:
+        index = PrefixIndex()
+        for path in snap.files:
+            for sheet_name in snap.sheets.get(path) or ():
+                index.add((path, sheet_name), f"{path.stem} {sheet_name}")
+        _sheets = (snap.version, index)
+    return _sheets[1]
+
+def install() -> None:
+    """Rebuild the sheet index on the watcher thread when the folder changes, not during a query."""
+    folder_watcher.add_listener(lambda _path, _version: sheet_index())
@@ -0,0 +1,143 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Generate synthetic workbooks and time the bot's hot paths against them.
+
+    python -m gridbot.bench generate --rows 50000 --out ./bench_data
+    python -m gridbot.bench run --rows 10000 --iterations 20 --output results.json
+    python -m gridbot.bench webhook --concurrency 1,16,64 --users 200 --updates 5000
+
+`run` and `webhook` work in a scratch directory: the Excel folder, favourites DB,
+cell index and model cache all point there, so a real deployment's files are never
+touched. `webhook` POSTs updates to the bot's webhook server on localhost and
+answers Bot API calls in-process.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from .generate import WorkbookSpec, generate
+
+def _add_spec_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--rows", type=int, default=1000)
+    p.add_argument("--cols", type=int, default=10)
+    p.add_argument("--sheets", type=int, default=3)
+    p.add_argument("--shared-strings", type=float, default=0.3, help="fraction of cells drawn from a small string pool")
+    p.add_argument("--formulas", type=float, default=0.1, help="fraction of cells holding a formula")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--formats", default="xlsx,xls", help="comma-separated: xlsx, xls (xls needs xlwt)")
+
+def _spec(args: argparse.Namespace) -> WorkbookSpec:
+    return WorkbookSpec(args.rows, args.cols, args.sheets, args.shared_strings, args.formulas, args.seed)
+
+def _formats(args: argparse.Namespace) -> tuple[str, ...]:
+    return tuple(f.strip().lower() for f in args.formats.split(",") if f.strip())
+
+def _cmd_generate(args: argparse.Namespace) -> None:
+    for path in generate(Path(args.out), _spec(args), _formats(args)):
+        print(path)
+
+def _setup(args: argparse.Namespace) -> tuple[Path, WorkbookSpec, list[Path], dict[str, Any]]:
+    """Point config at a scratch dir, generate the workbooks there; returns (folder, spec, files, meta)."""
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="gridbot-bench-")).resolve()
+    folder = workdir / "excel"
+    # Must be set before any gridbot module reads config
+    os.environ.update({
+        "EXCEL_FOLDER": str(folder),
+        "DB_PATH": str(workdir / "favourites.db"),
+        "INDEX_DB_PATH": str(workdir / "cell_index.db"),
+        "MODEL_CACHE_DIR": str(workdir / "model_cache"),
+        "AUTHORIZED_USERS": "",
+    })
+    spec = _spec(args)
+    t0 = time.perf_counter()
+    files = generate(folder, spec, _formats(args))
+    meta = {
+        "spec": spec.as_dict(),
+        "files": {p.name: p.stat().st_size for p in files},
+        "generate_seconds": time.perf_counter() - t0,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "workdir": str(workdir),
+    }
+    return folder, spec, files, meta
+
+def _write(report: dict[str, Any], output: str | None) -> None:
+    text = json.dumps(report, indent=2)
+    if output:
+        Path(output).write_text(text)
+    else:
+        print(text)
+
+def _cmd_run(args: argparse.Namespace) -> None:
+    folder, spec, files, meta = _setup(args)
+    from . import e2e, micro
+    meta["iterations"] = args.iterations
+    _write({
+        "meta": meta,
+        "micro": micro.run(folder, files, spec.rows, args.iterations),
+        "e2e": e2e.run(files, args.iterations),
+    }, args.output)
+
+def _cmd_webhook(args: argparse.Namespace) -> None:
+    _folder, _spec_, _files, meta = _setup(args)
+    from . import webhook
+    levels = [int(n) for n in args.concurrency.split(",") if n.strip()]
+    meta.update(users=args.users, updates=args.updates, api_latency_ms=args.api_latency_ms, clients=args.clients)
+    results = webhook.run(levels, args.users, args.updates, args.api_latency_ms / 1000, args.clients)
+    _write({"meta": meta, "webhook": results}, args.output)
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m gridbot.bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="write synthetic workbooks")
+    _add_spec_args(gen)
+    gen.add_argument("--out", default="bench_data")
+    gen.set_defaults(func=_cmd_generate)
+
+    run = sub.add_parser("run", help="generate workbooks in a scratch dir and time the hot paths")
+    _add_spec_args(run)
+    run.add_argument("--iterations", type=int, default=10)
+    run.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    run.add_argument("--output", help="write the JSON report here instead of stdout")
+    run.set_defaults(func=_cmd_run)
+
+    hook = sub.add_parser("webhook", help="POST updates to a local webhook server and measure throughput")
+    _add_spec_args(hook)
+    hook.add_argument("--concurrency", default="1,16,64", help="comma-separated UPDATE_CONCURRENCY values to compare")
+    hook.add_argument("--users", type=int, default=100)
+    hook.add_argument("--updates", type=int, default=2000)
+    hook.add_argument("--api-latency-ms", type=float, default=50.0, help="simulated Bot API round trip")
+    hook.add_argument("--clients", type=int, default=40, help="concurrent POST connections (Telegram uses up to 40)")
+    hook.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    hook.add_argument("--output", help="write the JSON report here instead of stdout")
+    hook.set_defaults(func=_cmd_webhook, rows=200, formats="xlsx")
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
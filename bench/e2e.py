@@ -0,0 +1,80 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import asyncio
+from pathlib import Path
+from typing import Any
+
+from .. import database, excel, handlers
+from ..state import set_state
+from ..watcher import folder_watcher
+from .fakes import FakeContext, FakeUpdate
+from .micro import reset_caches, warm_up
+from .timing import measure_async
+
+_USER = 1
+
+async def _callback(data: str) -> list:
+    update = FakeUpdate(_USER, data=data)
+    await handlers.on_callback(update, FakeContext())
+    return update.sent
+
+async def _text(text: str) -> list:
+    update = FakeUpdate(_USER, text=text)
+    await handlers.handle_text(update, FakeContext())
+    return update.sent
+
+async def _choose_file(idx: int) -> list:
+    await _callback("menu:files")
+    return await _callback(f"file:{idx}")
+
+async def _lookup(file_path: Path, sheet_name: str, text: str) -> list:
+    # Jump straight to the cell prompt so only the lookup itself is timed
+    set_state(_USER, "choose_cell", file=file_path, sheet=sheet_name)
+    return await _text(text)
+
+def run(files: list[Path], iterations: int) -> dict[str, Any]:
+    """Drive on_callback/handle_text the way a chat would, for each generated workbook."""
+    database.init_db()
+    snapshot = folder_watcher.wait()
+    listed = list(snapshot.files) if snapshot else []
+    loop = asyncio.new_event_loop()
+    results: dict[str, Any] = {}
+    try:
+        results["on_callback[menu:files]"] = measure_async(loop, lambda: _callback("menu:files"), iterations)
+        for path in files:
+            fmt = path.suffix.lstrip(".")
+            sheet = excel.list_sheets(path)[0]
+            results[f"on_callback[file:,{fmt}]"] = measure_async(
+                loop, lambda i=listed.index(path): _choose_file(i), iterations
+            )
+            for label, text in (("cell", "C3"), ("range", "A1:E20"), ("list", "A1,B2,C3,D4")):
+                fn = lambda p=path, t=text: _lookup(p, sheet, t)  # noqa: E731
+                cold = measure_async(loop, fn, iterations, setup=reset_caches)
+                warm_up(lambda: loop.run_until_complete(fn()))
+                results[f"handle_text[{label},{fmt}]"] = {"cold": cold, "warm": measure_async(loop, fn, iterations)}
+
+            nickname = f"bench-{fmt}"
+            database.add_favourite(_USER, nickname, str(path), sheet, "B2")
+            fav_id = next(f[0] for f in database.get_favourites(_USER) if f[1] == nickname)
+            fav = lambda i=fav_id: _callback(f"fav:{i}")  # noqa: E731
+            cold = measure_async(loop, fav, iterations, setup=reset_caches)
+            warm_up(lambda: loop.run_until_complete(fav()))
+            results[f"on_callback[fav:,{fmt}]"] = {"cold": cold, "warm": measure_async(loop, fav, iterations)}
+    finally:
+        loop.close()
+    return results
@@ -0,0 +1,68 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Minimal stand-ins for the telegram objects the handlers touch; replies are recorded, not sent."""
+
+from __future__ import annotations
+from typing import Any
+
+class FakeUser:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+
+class FakeChat:
+    def __init__(self, chat_id: int) -> None:
+        self.id = chat_id
+
+class FakeMessage:
+    def __init__(self, text: str = "", sent: list | None = None) -> None:
+        self.text = text
+        self.sent: list[tuple[str, Any]] = sent if sent is not None else []
+
+    async def reply_text(self, text: str, **kwargs: Any) -> "FakeMessage":
+        self.sent.append(("text", text))
+        return FakeMessage(text, self.sent)
+
+    async def reply_document(self, document: Any, **kwargs: Any) -> "FakeMessage":
+        self.sent.append(("document", kwargs.get("filename")))
+        return FakeMessage("", self.sent)
+
+class FakeCallbackQuery:
+    def __init__(self, data: str, sent: list) -> None:
+        self.data = data
+        self.message = FakeMessage("", sent)
+        self.sent = sent
+
+    async def answer(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+    async def edit_message_text(self, text: str, **kwargs: Any) -> None:
+        self.sent.append(("edit", text))
+
+class FakeUpdate:
+    """An Update carrying either a text message or a callback query."""
+
+    def __init__(self, user_id: int, *, text: str | None = None, data: str | None = None) -> None:
+        self.sent: list[tuple[str, Any]] = []
+        self.effective_user = FakeUser(user_id)
+        self.effective_chat = FakeChat(user_id)
+        self.message = FakeMessage(text, self.sent) if text is not None else None
+        self.callback_query = FakeCallbackQuery(data, self.sent) if data is not None else None
+
+class FakeContext:
+    def __init__(self, args: list[str] | None = None) -> None:
+        self.args = args or []
+        self.bot = None
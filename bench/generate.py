@@ -0,0 +1,110 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import random
+from pathlib import Path
+
+from openpyxl.utils.cell import get_column_letter
+
+# Strings drawn from this pool repeat (shared strings); the rest are unique per cell
+_POOL_SIZE = 200
+
+class WorkbookSpec:
+    """Shape of a synthetic workbook."""
+
+    __slots__ = ("rows", "cols", "sheets", "shared_string_ratio", "formula_density", "seed")
+
+    def __init__(
+        self,
+        rows: int = 1000,
+        cols: int = 10,
+        sheets: int = 3,
+        shared_string_ratio: float = 0.3,
+        formula_density: float = 0.1,
+        seed: int = 1,
+    ) -> None:
+        self.rows = rows
+        self.cols = cols
+        self.sheets = sheets
+        self.shared_string_ratio = shared_string_ratio
+        self.formula_density = formula_density
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+def _cells(spec: WorkbookSpec, sheet_idx: int, rng: random.Random):
+    """Yield rows of (kind, payload): kind is 'num', 'str' or 'formula' (payload = A1-style expression)."""
+    for r in range(1, spec.rows + 1):
+        row = []
+        for c in range(1, spec.cols + 1):
+            roll = rng.random()
+            if c > 1 and r > 1 and roll < spec.formula_density:
+                # Mix of local and cross-sheet references, always to earlier cells
+                left = f"{get_column_letter(c - 1)}{r}"
+                up = f"{get_column_letter(c)}{r - 1}"
+                if sheet_idx > 0 and rng.random() < 0.2:
+                    up = f"'Sheet1'!{get_column_letter(c)}{r}"
+                row.append(("formula", f"{left}+{up}"))
+            elif roll < spec.formula_density + spec.shared_string_ratio:
+                row.append(("str", f"label{rng.randrange(_POOL_SIZE)}"))
+            elif roll < spec.formula_density + spec.shared_string_ratio + 0.1:
+                row.append(("str", f"text-{sheet_idx}-{r}-{c}"))
+            else:
+                row.append(("num", round(rng.uniform(-1e6, 1e6), 2)))
+        yield row
+
+def write_xlsx(path: Path, spec: WorkbookSpec) -> Path:
+    from openpyxl import Workbook
+    rng = random.Random(spec.seed)
+    wb = Workbook(write_only=True)
+    for s in range(spec.sheets):
+        ws = wb.create_sheet(f"Sheet{s + 1}")
+        for row in _cells(spec, s, rng):
+            ws.append([f"={p}" if kind == "formula" else p for kind, p in row])
+    wb.save(path)
+    return path
+
+def write_xls(path: Path, spec: WorkbookSpec) -> Path:
+    """Legacy .xls output needs the optional `xlwt` package (not a runtime dependency)."""
+    try:
+        import xlwt
+    except ImportError as e:
+        raise RuntimeError("Generating .xls files requires `pip install xlwt`.") from e
+    if spec.rows > 65536 or spec.cols > 256:
+        raise ValueError(".xls sheets are limited to 65536 rows and 256 columns.")
+    rng = random.Random(spec.seed)
+    wb = xlwt.Workbook()
+    for s in range(spec.sheets):
+        ws = wb.add_sheet(f"Sheet{s + 1}")
+        for r, row in enumerate(_cells(spec, s, rng)):
+            for c, (kind, p) in enumerate(row):
+                ws.write(r, c, xlwt.Formula(p.replace("'Sheet1'!", "Sheet1!")) if kind == "formula" else p)
+    wb.save(path.as_posix())
+    return path
+
+def generate(folder: Path, spec: WorkbookSpec, formats: tuple[str, ...] = ("xlsx", "xls")) -> list[Path]:
+    """Write one workbook per format into `folder`; formats that can't be produced here are skipped."""
+    folder.mkdir(parents=True, exist_ok=True)
+    out: list[Path] = []
+    for fmt in formats:
+        path = folder / f"bench_{spec.rows}x{spec.cols}x{spec.sheets}.{fmt}"
+        try:
+            out.append(write_xlsx(path, spec) if fmt == "xlsx" else write_xls(path, spec))
+        except RuntimeError as e:
+            print(f"skipping .{fmt}: {e}")
+    return out
@@ -0,0 +1,70 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import shutil
+from pathlib import Path
+from typing import Any
+
+from .. import cell_index, excel, xlsx_stream
+from ..config import MODEL_CACHE_DIR
+from .timing import measure
+
+def reset_caches() -> None:
+    """Forget in-memory and on-disk caches so the next call pays the full cold cost."""
+    cell_index.clear()
+    excel.clear_caches()
+    if MODEL_CACHE_DIR:
+        shutil.rmtree(MODEL_CACHE_DIR, ignore_errors=True)
+
+def warm_up(fn) -> None:
+    fn()
+    # Let the background index build finish so it doesn't overlap the measurement
+    cell_index.wait_idle()
+    fn()
+
+def _first_formula(path: Path, sheet: str) -> str | None:
+    if path.suffix.lower() != ".xlsx":
+        return None
+    for coord, formula, _value in xlsx_stream.iter_formula_cells(path, sheet):
+        if formula:
+            return coord
+    return None
+
+def _cold_and_warm(fn, iterations: int) -> dict[str, Any]:
+    cold = measure(fn, iterations, setup=reset_caches)
+    warm_up(fn)
+    warm = measure(fn, iterations)
+    return {"cold": cold, "warm": warm}
+
+def run(folder: Path, files: list[Path], rows: int, iterations: int) -> dict[str, Any]:
+    results: dict[str, Any] = {
+        # Not cached at all (the bot's menus use the watcher's snapshot instead), so one number
+        "list_excel_files": {"uncached": measure(lambda: excel.list_excel_files(folder), iterations)},
+    }
+    for path in files:
+        fmt = path.suffix.lstrip(".")
+        sheet = excel.list_sheets(path)[0]
+        results[f"list_sheets[{fmt}]"] = _cold_and_warm(lambda p=path: excel.list_sheets(p), iterations)
+        cells = {"top": "B2", "bottom": f"B{rows}"}
+        formula = _first_formula(path, sheet)
+        if formula:
+            cells["formula"] = formula
+        for label, coord in cells.items():
+            results[f"read_cell[{fmt},{label}]"] = _cold_and_warm(
+                lambda p=path, c=coord: excel.read_cell(p, sheet, c), iterations
+            )
+    return results
@@ -0,0 +1,71 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable
+
+def percentile(sorted_samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples) + 0.5) - 1))
+    return sorted_samples[rank]
+
+def summarize(samples_s: list[float], peak_bytes: int) -> dict[str, Any]:
+    ms = sorted(s * 1000 for s in samples_s)
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms) if ms else 0.0,
+        "min_ms": ms[0] if ms else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p90_ms": percentile(ms, 90),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": ms[-1] if ms else 0.0,
+        "peak_mem_bytes": peak_bytes,
+    }
+
+def measure(fn: Callable[[], Any], iterations: int, setup: Callable[[], Any] | None = None) -> dict[str, Any]:
+    """Time `fn` `iterations` times (calling `setup` untimed before each), then once more under tracemalloc."""
+    samples: list[float] = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    # Memory is measured on a separate run: tracemalloc would distort the timings
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarize(samples, peak)
+
+def measure_async(
+    loop: asyncio.AbstractEventLoop,
+    make_coro: Callable[[], Awaitable[Any]],
+    iterations: int,
+    setup: Callable[[], Any] | None = None,
+) -> dict[str, Any]:
+    """Like `measure` for coroutines; every run uses `loop` (asyncio primitives stay bound to it)."""
+    return measure(lambda: loop.run_until_complete(make_coro()), iterations, setup)
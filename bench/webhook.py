@@ -0,0 +1,195 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Webhook throughput: POST update payloads to the bot's own webhook server on localhost.
+
+Bot API calls are answered in-process by `LocalBotRequest` (optionally after a
+simulated round trip), so nothing reaches Telegram.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import socket
+import time
+from typing import Any
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest, RequestData
+
+from .timing import summarize
+
+_TOKEN = "123456:bench"
+_SECRET = "bench-secret"
+
+class LocalBotRequest(BaseRequest):
+    """Answers the Bot API methods the handlers use, after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls = 0
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None, *args: Any, **kwargs: Any) -> tuple[int, bytes]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result: Any = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif api_method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id") or 1)
+            result = {
+                "message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+            }
+        else:
+            # setWebhook, deleteWebhook, answerCallbackQuery, sendDocument, …
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+def _chat(uid: int) -> dict:
+    return {"id": uid, "type": "private"}
+
+def _callback_update(update_id: int, uid: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": _user(uid), "chat_instance": str(uid), "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": _chat(uid), "text": "menu"},
+        },
+    }
+
+def _text_update(update_id: int, uid: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": _chat(uid), "from": _user(uid), "text": text},
+    }
+
+# One user's conversation: browse to a sheet, read a cell, decline to save it
+_SCRIPT = (("cb", "menu:files"), ("cb", "file:0"), ("cb", "sheet:0"), ("text", "B2"), ("cb", "exit"))
+
+def _sender(body: dict) -> int:
+    return (body.get("message") or body["callback_query"])["from"]["id"]
+
+def payloads(users: int, updates: int) -> list[dict]:
+    out = []
+    for i in range(updates):
+        uid = 1000 + i % users
+        kind, value = _SCRIPT[(i // users) % len(_SCRIPT)]
+        make = _callback_update if kind == "cb" else _text_update
+        out.append(make(i + 1, uid, value))
+    return out
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def _run_once(app: Application, bodies: list[dict], clients: int) -> dict[str, Any]:
+    import httpx
+    port = _free_port()
+    started: dict[int, float] = {}
+    done: dict[int, float] = {}
+    order: dict[int, list[int]] = {}
+    all_done = asyncio.Event()
+
+    async def record_start(update: Update, _context) -> None:
+        order.setdefault(update.effective_user.id, []).append(update.update_id)
+
+    async def record_done(update: Update, _context) -> None:
+        done[update.update_id] = time.perf_counter()
+        if len(done) == len(bodies):
+            all_done.set()
+
+    app.add_handler(TypeHandler(Update, record_start), group=-1)
+    app.add_handler(TypeHandler(Update, record_done), group=1)
+    await app.initialize()
+    await app.start()
+    await app.updater.start_webhook(
+        listen="127.0.0.1", port=port, url_path="hook",
+        webhook_url="https://bench.invalid/hook", secret_token=_SECRET,
+    )
+    try:
+        sem = asyncio.Semaphore(clients)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            async def post_user(user_bodies: list[dict]) -> None:
+                # Like Telegram: one chat's updates are delivered one after another
+                for body in user_bodies:
+                    async with sem:
+                        started[body["update_id"]] = time.perf_counter()
+                        r = await client.post("/hook", json=body, headers={"X-Telegram-Bot-Api-Secret-Token": _SECRET})
+                        r.raise_for_status()
+
+            by_user: dict[int, list[dict]] = {}
+            for body in bodies:
+                by_user.setdefault(_sender(body), []).append(body)
+            t0 = time.perf_counter()
+            await asyncio.gather(*(post_user(b) for b in by_user.values()))
+            await asyncio.wait_for(all_done.wait(), timeout=300)
+            elapsed = time.perf_counter() - t0
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+
+    out_of_order = sum(1 for ids in order.values() if ids != sorted(ids))
+    report = summarize([done[u] - started[u] for u in done], 0)
+    report.pop("peak_mem_bytes")
+    report.update({
+        "updates": len(bodies),
+        "seconds": elapsed,
+        "updates_per_second": len(bodies) / elapsed if elapsed else 0.0,
+        "users_out_of_order": out_of_order,
+    })
+    return report
+
+def run(concurrency_levels: list[int], users: int, updates: int, api_latency: float, clients: int) -> dict[str, Any]:
+    """Throughput and end-to-end latency (POST to handlers done) per UPDATE_CONCURRENCY value."""
+    from .. import database
+    from ..main import build_app
+    from ..watcher import folder_watcher
+    database.init_db()
+    folder_watcher.wait()
+    bodies = payloads(users, updates)
+
+    # One loop for every level: the I/O helpers' asyncio primitives stay bound to it
+    async def run_all() -> dict[str, Any]:
+        results: dict[str, Any] = {}
+        for level in concurrency_levels:
+            request = LocalBotRequest(api_latency)
+            report = await _run_once(build_app(_TOKEN, request, level), bodies, clients)
+            report["api_calls"] = request.calls
+            results[f"concurrency={level}"] = report
+        return results
+
+    return asyncio.run(run_all())
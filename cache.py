@@ -0,0 +1,135 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable
+
+# (mtime_ns, size) — cheap to compute and changes whenever a file is rewritten
+FileVersion = tuple[int, int]
+
+def file_version(path: Path) -> FileVersion:
+    """Return the on-disk version of a file as (mtime_ns, size)."""
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count and an approximate byte budget.
+
+    `max_bytes=0` disables the byte budget. Evicted values are passed to `on_evict`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int = 0,
+        on_evict: Callable[[Hashable, Any], None] | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> None:
+        evicted: list[tuple[Hashable, Any]] = []
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+                if old[0] is not value:
+                    evicted.append((key, old[0]))
+            self._data[key] = (value, size)
+            self._bytes += size
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while len(self._data) > 1 and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                k, (v, s) = self._data.popitem(last=False)
+                self._bytes -= s
+                evicted.append((k, v))
+        self._evict(evicted)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+            self._bytes -= item[1]
+        self._evict([(key, item[0])])
+        return item[0]
+
+    def discard_where(self, pred: Callable[[Hashable], bool]) -> None:
+        """Drop every entry whose key matches `pred`."""
+        evicted: list[tuple[Hashable, Any]] = []
+        with self._lock:
+            for k in [k for k in self._data if pred(k)]:
+                v, s = self._data.pop(k)
+                self._bytes -= s
+                evicted.append((k, v))
+        self._evict(evicted)
+
+    def clear(self) -> None:
+        self.discard_where(lambda _k: True)
+
+    def _evict(self, items: list[tuple[Hashable, Any]]) -> None:
+        if self._on_evict is None:
+            return
+        for k, v in items:
+            try:
+                self._on_evict(k, v)
+            except Exception:  # noqa: BLE001
+                pass
+
+class KeyedLocks:
+    """Hand out one lock per key so concurrent loads of the same item run once."""
+
+    def __init__(self) -> None:
+        self._locks: dict[Hashable, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def __call__(self, key: Hashable) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
@@ -0,0 +1,351 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import queue
+import re
+import sqlite3
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterator
+
+from .cache import FileVersion, file_version
+from .config import INDEX_DB_PATH
+from . import metrics, xlsx_stream
+
+MISS = xlsx_stream.MISS
+
+# How a stored value is turned back into what read_cell would have produced
+_KIND_NATIVE = 0   # int / float / str as stored
+_KIND_BOOL = 1     # stored as 0/1
+_KIND_TEXT = 2     # datetimes etc., stored as their display text
+_KIND_LIVE = 3     # needs a live read (uncached formula, date needing conversion)
+
+_BATCH = 5000
+
+_local = threading.local()
+_pending: set[Path] = set()
+_pending_lock = threading.Lock()
+# (path, version to build), or (path, None) to forget a deleted workbook
+_jobs: queue.Queue[tuple[Path, FileVersion | None]] = queue.Queue()
+_worker: threading.Thread | None = None
+
+def _conn() -> sqlite3.Connection:
+    """One connection per thread; WAL lets lookups proceed while a rebuild writes."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(INDEX_DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS workbooks (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cells (
+                path TEXT NOT NULL,
+                sheet TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                col INTEGER NOT NULL,
+                kind INTEGER NOT NULL,
+                value,
+                PRIMARY KEY (path, sheet, row, col)
+            ) WITHOUT ROWID
+        """)
+        # Inverted index for /find: normalised words and numbers -> cells.
+        # Clustered on term, so exact and prefix lookups are one range scan.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT NOT NULL,
+                path TEXT NOT NULL,
+                sheet TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                col INTEGER NOT NULL,
+                PRIMARY KEY (term, path, sheet, row, col)
+            ) WITHOUT ROWID
+        """)
+        # Terms by cell: checks a candidate cell for the other words of a query (and serves forget by path)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_terms_cell ON terms(path, sheet, row, col, term)")
+        conn.execute("DROP INDEX IF EXISTS idx_terms_path")
+        # Indexes built before the terms table existed have no terms: rebuild them
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            with conn:
+                conn.execute("DELETE FROM workbooks")
+                conn.execute("PRAGMA user_version = 1")
+        _local.conn = conn
+    return conn
+
+def _encode(value: Any) -> tuple[int, Any]:
+    if value is MISS:
+        return _KIND_LIVE, None
+    if isinstance(value, bool):
+        return _KIND_BOOL, int(value)
+    if isinstance(value, (int, float, str)):
+        return _KIND_NATIVE, value
+    return _KIND_TEXT, str(value)
+
+def _decode(kind: int, value: Any) -> Any:
+    if kind == _KIND_LIVE:
+        return MISS
+    if kind == _KIND_BOOL:
+        return bool(value)
+    return value
+
+# ---------- Terms ----------
+
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[^\W_]+")
+_MAX_TERM = 64
+
+def _normalise(token: str) -> str:
+    # 1234.50 and 1234.5 are the same number; 12.00 is 12
+    if "." in token and token[0].isdigit():
+        token = token.rstrip("0").rstrip(".")
+    return token[:_MAX_TERM]
+
+def terms(value: Any) -> set[str]:
+    """Search terms of a cell value (or of a query): lower-cased words and plain numbers."""
+    if value is None or value is MISS or isinstance(value, bool):
+        return set()
+    if isinstance(value, (int, float)):
+        text = f"{value:.10f}" if isinstance(value, float) else str(value)
+        return {_normalise(text.lstrip("-"))}
+    text = _THOUSANDS_RE.sub("", str(value).casefold())
+    return {_normalise(t) for t in _TOKEN_RE.findall(text)}
+
+# Postings counted per word when picking the one to drive a query from
+_SELECTIVITY_PROBE = 10_000
+
+def search_terms(words: list[str], exact: bool, limit: int) -> list[tuple[str, str, int, int, Any]]:
+    """Cells matching every word (as a prefix unless `exact`): (path, sheet, row, col, value)."""
+    if not words:
+        return []
+    conn = _conn()
+
+    def bounds(word: str) -> list[str]:
+        return [word] if exact else [word, word + "\U0010ffff"]
+
+    match = "term = ?" if exact else "term >= ? AND term < ?"
+    # Walk the postings of the rarest word (counted up to a cap) and probe each cell for the others
+    counts = {
+        word: conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM terms WHERE {match} LIMIT ?)", (*bounds(word), _SELECTIVITY_PROBE)
+        ).fetchone()[0]
+        for word in words
+    }
+    driver = min(words, key=counts.__getitem__)
+    if not counts[driver]:
+        return []
+    others = [w for w in words if w != driver]
+    probes = "".join(
+        f"""
+        AND EXISTS (
+            SELECT 1 FROM terms u INDEXED BY idx_terms_cell
+            WHERE u.path = t.path AND u.sheet = t.sheet AND u.row = t.row AND u.col = t.col AND u.{match}
+        )"""
+        for _ in others
+    )
+    rows = conn.execute(
+        f"""
+        SELECT t.path, t.sheet, t.row, t.col, c.kind, c.value
+        FROM terms t
+        LEFT JOIN cells c ON c.path = t.path AND c.sheet = t.sheet AND c.row = t.row AND c.col = t.col
+        WHERE t.{match}{probes}
+        """,
+        [*bounds(driver), *(b for w in others for b in bounds(w))],
+    )
+    # Streamed in index order and stopped at `limit`; a cell with several terms under a prefix comes up once
+    found: dict[tuple[str, str, int, int], Any] = {}
+    for path, sheet, row, col, kind, value in rows:
+        found.setdefault((path, sheet, row, col), None if kind is None else _decode(kind, value))
+        if len(found) == limit:
+            break
+    return [(*cell, value) for cell, value in found.items()]
+
+def is_current(path: Path, version: FileVersion) -> bool:
+    """True if `path` (resolved) is indexed at `version`."""
+    indexed = _conn().execute(
+        "SELECT mtime_ns, size FROM workbooks WHERE path=?", (path.as_posix(),)
+    ).fetchone()
+    return indexed is not None and tuple(indexed) == version
+
+def forget(path: Path) -> None:
+    """Remove a deleted workbook from the index now (see `schedule_forget`)."""
+    if not INDEX_DB_PATH:
+        return
+    conn = _conn()
+    key = path.resolve().as_posix()
+    with conn:
+        conn.execute("DELETE FROM workbooks WHERE path=?", (key,))
+        conn.execute("DELETE FROM cells WHERE path=?", (key,))
+        conn.execute("DELETE FROM terms WHERE path=?", (key,))
+
+def clear() -> None:
+    """Drop the whole index; workbooks are re-indexed as they are next scheduled."""
+    if not INDEX_DB_PATH:
+        return
+    wait_idle()
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM workbooks")
+        conn.execute("DELETE FROM cells")
+        conn.execute("DELETE FROM terms")
+
+def _iter_workbook(path: Path) -> Iterator[tuple[str, int, int, Any]]:
+    """Yield (sheet, row, col, value) for every non-empty cell, 1-based."""
+    if path.suffix.lower() == ".xlsx":
+        for sheet in xlsx_stream.sheet_names(path):
+            for row, col, value in xlsx_stream.iter_cells(path, sheet):
+                yield sheet, row, col, value
+        return
+    import xlrd
+    wb = xlrd.open_workbook(path.as_posix(), on_demand=True)
+    try:
+        for sheet in wb.sheet_names():
+            sh = wb.sheet_by_name(sheet)
+            for r in range(sh.nrows):
+                for c, cell in enumerate(sh.row(r)):
+                    if cell.ctype not in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                        yield sheet, r + 1, c + 1, cell.value
+            wb.unload_sheet(sheet)
+    finally:
+        wb.release_resources()
+
+@metrics.timed("cell_index.build")
+def _build(path: Path, version: FileVersion) -> None:
+    conn = _conn()
+    key = path.as_posix()
+    rows = (
+        (key, sheet, row, col, *_encode(value))
+        for sheet, row, col, value in _iter_workbook(path)
+    )
+    with conn:
+        # Forget the old version first, so a half-built index is never trusted
+        conn.execute("DELETE FROM workbooks WHERE path=?", (key,))
+        conn.execute("DELETE FROM cells WHERE path=?", (key,))
+        conn.execute("DELETE FROM terms WHERE path=?", (key,))
+        while batch := list(islice(rows, _BATCH)):
+            conn.executemany("INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?)", batch)
+            conn.executemany(
+                "INSERT OR IGNORE INTO terms VALUES (?, ?, ?, ?, ?)",
+                [
+                    (term, key, sheet, row, col)
+                    for _key, sheet, row, col, kind, value in batch
+                    for term in terms(value if kind != _KIND_BOOL else None)
+                ],
+            )
+        conn.execute("INSERT INTO workbooks VALUES (?, ?, ?)", (key, *version))
+
+def _work() -> None:
+    while True:
+        path, version = _jobs.get()
+        try:
+            if version is None:
+                forget(path)
+            # Skip builds overtaken by another change to the file
+            elif file_version(path) == version:
+                _build(path, version)
+        except Exception:  # noqa: BLE001
+            # Unreadable workbook: lookups keep using the live path
+            pass
+        finally:
+            if version is not None:
+                with _pending_lock:
+                    _pending.discard(path)
+            _jobs.task_done()
+
+def _start_worker() -> None:
+    global _worker
+    if _worker is None:
+        _worker = threading.Thread(target=_work, name="gridbot-indexer", daemon=True)
+        _worker.start()
+
+def wait_idle() -> None:
+    """Block until every scheduled build and removal has finished."""
+    _jobs.join()
+
+# Off in worker processes: the main process keeps the index current
+_builds_enabled = True
+
+def disable_builds() -> None:
+    """Leave (re)indexing to another process; lookups still read the index."""
+    global _builds_enabled
+    _builds_enabled = False
+
+def schedule_build(path: Path, version: FileVersion) -> None:
+    """Queue a background (re)index of `path`, once per path at a time."""
+    if not _builds_enabled:
+        return
+    with _pending_lock:
+        if path in _pending:
+            return
+        _pending.add(path)
+        _start_worker()
+    _jobs.put((path, version))
+
+def schedule_forget(path: Path) -> None:
+    """Queue removal of a deleted workbook behind any build in progress, instead of waiting on its write lock."""
+    if not INDEX_DB_PATH or not _builds_enabled:
+        return
+    with _pending_lock:
+        _start_worker()
+    _jobs.put((path, None))
+
+_stats = metrics.HitCounter()
+metrics.register_cache("cell_index", _stats)
+
+def lookup(file_path: Path, sheet_name: str, row: int, col: int) -> Any:
+    """Return the indexed value of a cell (None if empty) or MISS if the index can't answer.
+
+    An index that is missing or older than the file triggers a background rebuild.
+    """
+    value = _lookup(file_path, sheet_name, row, col)
+    if value is MISS:
+        _stats.miss()
+    else:
+        _stats.hit()
+    return value
+
+def _lookup(file_path: Path, sheet_name: str, row: int, col: int) -> Any:
+    if not INDEX_DB_PATH:
+        return MISS
+    path = file_path.resolve()
+    version = file_version(path)
+    conn = _conn()
+    indexed = conn.execute(
+        "SELECT mtime_ns, size FROM workbooks WHERE path=?", (path.as_posix(),)
+    ).fetchone()
+    if indexed is None or tuple(indexed) != version:
+        schedule_build(path, version)
+        return MISS
+    found = conn.execute(
+        "SELECT kind, value FROM cells WHERE path=? AND sheet=? AND row=? AND col=?",
+        (path.as_posix(), sheet_name, row, col),
+    ).fetchone()
+    if found is None:
+        # xlrd reports blanks inside the used range as "", so let the live path answer those.
+        # Unknown sheet names also fall through so the live path can raise as before.
+        if path.suffix.lower() != ".xlsx":
+            return MISS
+        has_sheet = conn.execute(
+            "SELECT 1 FROM cells WHERE path=? AND sheet=? LIMIT 1", (path.as_posix(), sheet_name)
+        ).fetchone()
+        return None if has_sheet else MISS
+    return _decode(*found)
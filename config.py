@@ -36,3 +36,74 @@ AUTHORIZED_USERS: list[int] = [
     for u in os.getenv("AUTHORIZED_USERS", "").split(",")
     if u.strip()
 ]
+
+# Comma-separated Telegram user IDs allowed to use /stats (empty = nobody)
+ADMIN_USERS: list[int] = [
+    int(u.strip())
+    for u in os.getenv("ADMIN_USERS", "").split(",")
+    if u.strip()
+]
+
+# Workbook cache: max open workbooks and approximate memory budget (MB, 0 = unlimited)
+WORKBOOK_CACHE_MAX_ENTRIES: int = int(os.getenv("WORKBOOK_CACHE_MAX_ENTRIES", "8"))
+WORKBOOK_CACHE_MAX_MB: int = int(os.getenv("WORKBOOK_CACHE_MAX_MB", "512"))
+
+# Sheets of each open .xls book kept parsed; less recently used ones are unloaded
+XLS_LOADED_SHEETS: int = int(os.getenv("XLS_LOADED_SHEETS", "4"))
+
+# Formatted cell values kept per (file version, sheet, cell) so repeated lookups skip the workbook
+RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "50000"))
+
+# Compiled xlcalculator models: max kept in memory, and on-disk cache folder ("" disables)
+MODEL_CACHE_MAX_ENTRIES: int = int(os.getenv("MODEL_CACHE_MAX_ENTRIES", "4"))
+MODEL_CACHE_DIR: str = os.getenv("MODEL_CACHE_DIR", "model_cache")
+
+# Worker threads for workbook/database I/O, and how many may work on the same file at once
+IO_MAX_WORKERS: int = int(os.getenv("IO_MAX_WORKERS", "4"))
+IO_PER_FILE_CONCURRENCY: int = int(os.getenv("IO_PER_FILE_CONCURRENCY", "1"))
+
+# Worker processes for workbook parsing and formula evaluation (0 = use the I/O threads above).
+# Each file is always handled by the same worker; one is replaced once it uses more than
+# WORKER_MAX_RSS_MB of memory (0 = no ceiling) or if it dies.
+WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", "0"))
+WORKER_MAX_RSS_MB: int = int(os.getenv("WORKER_MAX_RSS_MB", "1024"))
+
+# On-disk index of computed cell values, rebuilt in the background per workbook version ("" disables)
+INDEX_DB_PATH: str = os.getenv("INDEX_DB_PATH", "cell_index.db")
+
+# Folder watcher: seconds between full rescans. inotify reports local changes sooner, but on
+# network mounts changes made from other machines are only seen by these rescans
+FOLDER_POLL_SECONDS: float = float(os.getenv("FOLDER_POLL_SECONDS", "30"))
+
+# Workbooks pre-warmed in parallel by the background job
+PREWARM_CONCURRENCY: int = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+
+# Import the spreadsheet libraries in the background right after startup (1) or on first use (0)
+WARM_IMPORTS: bool = os.getenv("WARM_IMPORTS", "1") == "1"
+
+# Print how long startup takes (imports, init_db, application build) and exit instead of running
+STARTUP_PROFILE: bool = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+# Updates handled at the same time (each user's updates still run in order)
+UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+
+# Inline mode: milliseconds an answer may wait for values that aren't cached yet
+INLINE_BUDGET_MS: int = int(os.getenv("INLINE_BUDGET_MS", "300"))
+
+# Webhook mode: public HTTPS URL Telegram posts updates to (empty = long polling), the local
+# address the bot listens on behind the reverse proxy, and the shared secret Telegram sends back
+WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+
+# Conversation state: idle sessions expire after this many seconds, and at most this many stay in memory
+STATE_TTL_SECONDS: float = float(os.getenv("STATE_TTL_SECONDS", "3600"))
+STATE_MAX_SESSIONS: int = int(os.getenv("STATE_MAX_SESSIONS", "10000"))
+
+# SQLite file that keeps conversations across restarts ("" = memory only)
+STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "")
+
+# Prometheus text endpoint (GET /metrics); port 0 disables it, keep the host local
+METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
@@ -14,39 +14,102 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
+import logging
 import sqlite3
-from typing import Any, Iterable
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
 from .config import DB_PATH
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# One long-lived connection, shared by every thread and serialised by a lock
+_conn: sqlite3.Connection | None = None
+_lock = threading.RLock()
+
+# Awaitable helpers run on this dedicated thread so the event loop never blocks on SQLite
+_db_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gridbot-db")
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _conn = conn
+    return _conn
 
 def init_db() -> None:
-    """Create tables if they don’t exist."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS favourites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            nickname TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            sheet_name TEXT NOT NULL,
-            cell_coord TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
+    """Create tables and indexes if they don’t exist."""
+    with _lock:
+        conn = _connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS favourites (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                nickname TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                sheet_name TEXT NOT NULL,
+                cell_coord TEXT NOT NULL
+            )
+        """)
+        # Opt-in change alerts: the last value the user was told about
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(favourites)")}
+        if "subscribed" not in columns:
+            conn.execute("ALTER TABLE favourites ADD COLUMN subscribed INTEGER NOT NULL DEFAULT 0")
+        if "last_value" not in columns:
+            conn.execute("ALTER TABLE favourites ADD COLUMN last_value TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_favourites_user ON favourites(user_id)")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_favourites_subscribed
+            ON favourites(file_path) WHERE subscribed = 1
+        """)
+        # Older databases may hold the same cell twice (possibly under different nicknames).
+        # Those rows are the users' to remove, so uniqueness is only enforced once there are none;
+        # add_favourite never creates new duplicates either way.
+        duplicates = conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM favourites GROUP BY user_id, file_path, sheet_name, cell_coord HAVING COUNT(*) > 1
+            )
+        """).fetchone()[0]
+        if duplicates:
+            log.warning(
+                "%d favourite cells are saved more than once; not enforcing uniqueness until they are removed",
+                duplicates,
+            )
+        else:
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_favourites_unique
+                ON favourites(user_id, file_path, sheet_name, cell_coord)
+            """)
+        conn.commit()
+
+def close_db() -> None:
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
 
 def _run(query: str, params: Iterable[Any] = (), *, one: bool = False, all_: bool = False):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(query, params)
-    result = None
-    if one:
-        result = c.fetchone()
-    elif all_:
-        result = c.fetchall()
-    conn.commit()
-    conn.close()
-    return result
+    with _lock:
+        conn = _connect()
+        c = conn.execute(query, params)
+        result = None
+        if one:
+            result = c.fetchone()
+        elif all_:
+            result = c.fetchall()
+        conn.commit()
+        return result
+
+async def _in_db_thread(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    # Timed from the handler's side, so waiting for the DB thread counts too
+    with metrics.timer(f"db.{fn.__name__}"):
+        return await loop.run_in_executor(_db_pool, fn, *args)
 
 def get_favourites(user_id: int) -> list[tuple]:
     return _run(
@@ -55,18 +118,32 @@ def get_favourites(user_id: int) -> list[tuple]:
         all_=True
     ) or []
 
+def has_favourites(user_id: int) -> bool:
+    return _run("SELECT 1 FROM favourites WHERE user_id=? LIMIT 1", (user_id,), one=True) is not None
+
 def get_favourite_by_id(fav_id: int) -> tuple | None:
     return _run(
-        "SELECT id, nickname, file_path, sheet_name, cell_coord FROM favourites WHERE id=?",
+        "SELECT id, nickname, file_path, sheet_name, cell_coord, subscribed FROM favourites WHERE id=?",
         (fav_id,),
         one=True
     )
 
-def add_favourite(user_id: int, nickname: str, file_path: str, sheet_name: str, cell_coord: str) -> None:
-    _run(
-        "INSERT INTO favourites (user_id, nickname, file_path, sheet_name, cell_coord) VALUES (?, ?, ?, ?, ?)",
-        (user_id, nickname, file_path, sheet_name, cell_coord)
-    )
+def add_favourite(user_id: int, nickname: str, file_path: str, sheet_name: str, cell_coord: str) -> bool:
+    """Save a favourite; False if the user already has this cell (e.g. a concurrent save won)."""
+    with _lock:
+        conn = _connect()
+        c = conn.execute(
+            """
+            INSERT INTO favourites (user_id, nickname, file_path, sheet_name, cell_coord)
+            SELECT ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM favourites WHERE user_id=? AND file_path=? AND sheet_name=? AND cell_coord=?
+            )
+            """,
+            (user_id, nickname, file_path, sheet_name, cell_coord, user_id, file_path, sheet_name, cell_coord)
+        )
+        conn.commit()
+        return c.rowcount > 0
 
 def favourite_exists(user_id: int, file_path: str, sheet_name: str, cell_coord: str) -> bool:
     row = _run(
@@ -75,3 +152,71 @@ def favourite_exists(user_id: int, file_path: str, sheet_name: str, cell_coord:
         one=True
     )
     return row is not None
+
+def get_favourite_files() -> list[str]:
+    """Distinct workbook paths referenced by any user's favourites."""
+    return [row[0] for row in _run("SELECT DISTINCT file_path FROM favourites", all_=True) or []]
+
+def get_favourite_cells(file_path: str) -> list[tuple[str, str]]:
+    """Distinct (sheet_name, cell_coord) pairs favourited in one workbook."""
+    return _run(
+        "SELECT DISTINCT sheet_name, cell_coord FROM favourites WHERE file_path=?",
+        (file_path,),
+        all_=True
+    ) or []
+
+def set_subscribed(user_id: int, fav_id: int, subscribed: bool, last_value: str | None = None) -> bool:
+    """Turn alerts for one of the user's favourites on (remembering the value shown) or off."""
+    with _lock:
+        conn = _connect()
+        c = conn.execute(
+            "UPDATE favourites SET subscribed=?, last_value=? WHERE id=? AND user_id=?",
+            (int(subscribed), last_value, fav_id, user_id),
+        )
+        conn.commit()
+        return c.rowcount > 0
+
+def get_subscriptions(file_path: str) -> list[tuple]:
+    """(id, user_id, nickname, sheet_name, cell_coord, last_value) of subscribed favourites in one workbook."""
+    return _run(
+        "SELECT id, user_id, nickname, sheet_name, cell_coord, last_value FROM favourites "
+        "WHERE file_path=? AND subscribed=1",
+        (file_path,),
+        all_=True
+    ) or []
+
+def update_last_values(changes: list[tuple[str, int]]) -> None:
+    """Store new (last_value, id) pairs in one transaction."""
+    with _lock:
+        conn = _connect()
+        conn.executemany("UPDATE favourites SET last_value=? WHERE id=?", changes)
+        conn.commit()
+
+# ---------- Awaitable variants for the handlers ----------
+
+async def aget_favourites(user_id: int) -> list[tuple]:
+    return await _in_db_thread(get_favourites, user_id)
+
+async def ahas_favourites(user_id: int) -> bool:
+    return await _in_db_thread(has_favourites, user_id)
+
+async def aget_favourite_by_id(fav_id: int) -> tuple | None:
+    return await _in_db_thread(get_favourite_by_id, fav_id)
+
+async def aadd_favourite(user_id: int, nickname: str, file_path: str, sheet_name: str, cell_coord: str) -> bool:
+    return await _in_db_thread(add_favourite, user_id, nickname, file_path, sheet_name, cell_coord)
+
+async def afavourite_exists(user_id: int, file_path: str, sheet_name: str, cell_coord: str) -> bool:
+    return await _in_db_thread(favourite_exists, user_id, file_path, sheet_name, cell_coord)
+
+async def aget_favourite_files() -> list[str]:
+    return await _in_db_thread(get_favourite_files)
+
+async def aset_subscribed(user_id: int, fav_id: int, subscribed: bool, last_value: str | None = None) -> bool:
+    return await _in_db_thread(set_subscribed, user_id, fav_id, subscribed, last_value)
+
+async def aget_subscriptions(file_path: str) -> list[tuple]:
+    return await _in_db_thread(get_subscriptions, file_path)
+
+async def aupdate_last_values(changes: list[tuple[str, int]]) -> None:
+    await _in_db_thread(update_last_values, changes)
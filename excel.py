@@ -16,32 +16,213 @@
 
 from __future__ import annotations
 import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterable
-from openpyxl import load_workbook
-import xlrd
+from typing import Iterable, Iterator
+
+from .cache import LRUCache, KeyedLocks, FileVersion, file_version
+from .config import RESULT_CACHE_MAX_ENTRIES, WORKBOOK_CACHE_MAX_ENTRIES, WORKBOOK_CACHE_MAX_MB, XLS_LOADED_SHEETS
+from .formulas import evaluate
+from . import cell_index, lazy_eval, metrics, xlsx_stream
 
 HIDDEN_PREFIXES: tuple[str, ...] = (".", "~$")  # ignore macOS/Linux dotfiles and Office temp files
 
+def is_excel_name(name: str) -> bool:
+    """True for visible .xls/.xlsx file names (hidden and Office temp files excluded)."""
+    if any(name.startswith(p) for p in HIDDEN_PREFIXES):
+        return False
+    return Path(name).suffix.lower() in (".xls", ".xlsx")
+
+def sort_files(files: Iterable[Path]) -> list[Path]:
+    return sorted(files, key=lambda p: p.name.lower())
+
+@metrics.timed("excel.list_excel_files")
 def list_excel_files(folder: Path) -> list[Path]:
     """Return sorted list of visible Excel files (.xls/.xlsx), ignoring hidden/temp files."""
     files: list[Path] = []
     if not folder.exists():
         return files
     for f in folder.iterdir():
-        name = f.name
-        if any(name.startswith(p) for p in HIDDEN_PREFIXES):
-            continue
-        if f.is_file() and f.suffix.lower() in (".xls", ".xlsx"):
+        if is_excel_name(f.name) and f.is_file():
             files.append(f)
-    return sorted(files, key=lambda p: p.name.lower())
+    return sort_files(files)
 
-def list_sheets(file_path: Path) -> list[str]:
+# ---------- Workbook cache ----------
+
+class _CachedWorkbook:
+    """A cached workbook and how many reads are using it; closed once evicted and unused."""
+
+    __slots__ = ("wb", "readers", "evicted", "closed")
+
+    def __init__(self, wb) -> None:
+        self.wb = wb
+        self.readers = 0
+        self.evicted = False
+        self.closed = False
+
+_readers_lock = threading.Lock()
+
+def _close_if_idle(entry: _CachedWorkbook) -> None:
+    """Close `entry` if it is evicted and no read is using it (caller holds _readers_lock)."""
+    if entry.evicted and not entry.readers and not entry.closed:
+        entry.closed = True
+        # Release the zip handle or the mapped .xls file now rather than at garbage collection
+        entry.wb.close()
+
+def _evicted(_key, entry: _CachedWorkbook) -> None:
+    with _readers_lock:
+        entry.evicted = True
+        _close_if_idle(entry)
+
+# Keyed by (resolved path, mtime_ns, size); a changed file simply misses
+_workbooks = LRUCache(WORKBOOK_CACHE_MAX_ENTRIES, WORKBOOK_CACHE_MAX_MB * 1024 * 1024, on_evict=_evicted)
+_load_locks = KeyedLocks()
+metrics.register_cache("workbooks", _workbooks)
+
+class XlsBook:
+    """A legacy .xls book opened on demand over a memory-mapped file.
+
+    Only the global records (sheet list, shared strings, formats) are parsed up
+    front; a sheet is parsed the first time it is asked for, and the least recently
+    used ones are unloaded past XLS_LOADED_SHEETS. Callers still holding an
+    unloaded sheet keep a valid object; it is simply parsed again on next use.
+    """
+
+    def __init__(self, file_path: Path) -> None:
+        import xlrd
+        self.book = xlrd.open_workbook(file_path.as_posix(), on_demand=True, use_mmap=True)
+        self._loaded: OrderedDict[str, None] = OrderedDict()
+        # xlrd parses a sheet by seeking in the shared stream: one at a time
+        self._lock = threading.Lock()
+
+    def sheet_names(self) -> list[str]:
+        return self.book.sheet_names()
+
+    def close(self) -> None:
+        # The book's sheets refer back to it, so without this the mmap and file stay open until cyclic GC
+        self.book.release_resources()
+
+    def sheet_by_name(self, sheet_name: str):
+        with self._lock:
+            if sheet_name in self._loaded:
+                self._loaded.move_to_end(sheet_name)
+                return self.book.sheet_by_name(sheet_name)
+            with metrics.timer("excel.load_xls_sheet"):
+                sheet = self.book.sheet_by_name(sheet_name)
+            self._loaded[sheet_name] = None
+            while len(self._loaded) > XLS_LOADED_SHEETS:
+                idle, _ = self._loaded.popitem(last=False)
+                self.book.unload_sheet(idle)
+            return sheet
+
+@metrics.timed("excel.load_workbook")
+def _load(file_path: Path):
     if file_path.suffix.lower() == ".xlsx":
-        wb = load_workbook(file_path, read_only=True)
-        return list(wb.sheetnames)
-    wb = xlrd.open_workbook(file_path.as_posix())
-    return list(wb.sheet_names())
+        from openpyxl import load_workbook
+        return load_workbook(file_path, read_only=True, data_only=True)
+    return XlsBook(file_path)
+
+def import_libraries() -> None:
+    """Import the spreadsheet libraries now instead of during the first lookup that needs them.
+
+    They are imported lazily so the bot starts (and reconnects after a deploy) quickly.
+    """
+    import openpyxl  # noqa: F401
+    import openpyxl.formula.translate  # noqa: F401
+    import openpyxl.styles.numbers  # noqa: F401
+    import xlrd  # noqa: F401
+    import xlcalculator  # noqa: F401
+    import xlcalculator.xltypes  # noqa: F401
+
+def _cached_workbook(file_path: Path) -> _CachedWorkbook:
+    path = file_path.resolve()
+    version: FileVersion = file_version(path)
+    key = (path, *version)
+    entry = _workbooks.get(key)
+    if entry is not None:
+        return entry
+    with _load_locks(path):
+        entry = _workbooks.get(key)
+        if entry is not None:
+            return entry
+        # Drop any older version of this file before loading the new one
+        _workbooks.discard_where(lambda k: k[0] == path)
+        entry = _CachedWorkbook(_load(path))
+        # Charged at the file's size: read-only .xlsx books stream from the zip, and an .xls
+        # book's file is mapped rather than copied, with a few sheets loaded at most
+        _workbooks.put(key, entry, version[1])
+        return entry
+
+def get_workbook(file_path: Path) -> None:
+    """Load the workbook for `file_path` into the cache (reads go through `workbook`)."""
+    _cached_workbook(file_path)
+
+@contextmanager
+def workbook(file_path: Path) -> Iterator:
+    """An open workbook for `file_path`, reused while the file is unchanged on disk.
+
+    It stays open until the block ends, even if it is evicted meanwhile.
+    """
+    while True:
+        entry = _cached_workbook(file_path)
+        with _readers_lock:
+            if not entry.closed:
+                entry.readers += 1
+                break
+        # Evicted and closed between the lookup and now: the next lookup loads it again
+    try:
+        yield entry.wb
+    finally:
+        with _readers_lock:
+            entry.readers -= 1
+            _close_if_idle(entry)
+
+# ---------- Result cache ----------
+
+# Final formatted values by (path, mtime_ns, size, sheet, coord). Paths come from the
+# already-resolved EXCEL_FOLDER, so a hit costs a single stat() and no file access.
+_results = LRUCache(RESULT_CACHE_MAX_ENTRIES)
+_result_versions: dict[Path, FileVersion] = {}
+metrics.register_cache("results", _results)
+_MISSING = object()
+
+def _results_base(file_path: Path) -> tuple:
+    """Current (path, mtime_ns, size), dropping cached results of older versions of the file."""
+    version = file_version(file_path)
+    if _result_versions.get(file_path) != version:
+        _results.discard_where(lambda k: k[0] == file_path)
+        _result_versions[file_path] = version
+    return (file_path, *version)
+
+def cached_cells(file_path: Path, sheet_name: str, coords: list[str]) -> list | None:
+    """Formatted values if every cell is cached for the file's current version, else None."""
+    base = _results_base(file_path)
+    values = []
+    for coord in coords:
+        value = _results.get((*base, sheet_name, coord), _MISSING)
+        if value is _MISSING:
+            return None
+        values.append(value)
+    return values
+
+def clear_caches() -> None:
+    """Drop every in-memory workbook, package, formula and result cache (the on-disk ones are kept)."""
+    _results.clear()
+    _result_versions.clear()
+    _workbooks.clear()
+    xlsx_stream._packages.clear()
+    lazy_eval._memos.clear()
+    from .formulas import _models
+    _models.clear()
+
+@metrics.timed("excel.list_sheets")
+def list_sheets(file_path: Path) -> list[str]:
+    with workbook(file_path) as wb:
+        if file_path.suffix.lower() == ".xlsx":
+            return list(wb.sheetnames)
+        return list(wb.sheet_names())
 
 _CELL_RE = re.compile(r"^([A-Za-z]+)(\d+)$")
 
@@ -52,38 +233,196 @@ def _col_letters_to_index(letters: str) -> int:
         total = total * 26 + (ord(ch) - 64)
     return total - 1
 
-def read_cell(file_path: Path, sheet_name: str, cell_coord: str):
-    """Read a cell value. For .xlsx, try to resolve formulas using data_only; if empty, try xlcalculator."""
-    if file_path.suffix.lower() == ".xlsx":
-        wb = load_workbook(file_path, read_only=True, data_only=True)
-        sheet = wb[sheet_name]
-        value = sheet[cell_coord].value
-        if value is None:
-            # Attempt to evaluate formula offline using xlcalculator
-            try:
-                from xlcalculator import ModelCompiler, Model
-                from xlcalculator.reader import Reader
-                reader = Reader(file_path.as_posix())
-                compiler = ModelCompiler()
-                model = compiler.read_and_parse(reader.read())
-                calc = Model(model)
-                value = calc.evaluate(f"{sheet_name}!{cell_coord}")
-            except Exception as e:  # noqa: BLE001
-                value = f"Error calculating formula: {e}"
-        if isinstance(value, (int, float)):
-            return f"R{value:,.2f}"
-        return value
-
-    # .xls via xlrd
-    wb = xlrd.open_workbook(file_path.as_posix())
-    sh = wb.sheet_by_name(sheet_name)
-    m = _CELL_RE.match(cell_coord)
+_RANGE_RE = re.compile(r"^([A-Za-z]+)(\d+):([A-Za-z]+)(\d+)$")
+
+def parse_range(text: str) -> tuple[int, int, int, int] | None:
+    """Parse 'B2:F40' into 1-based (min_row, max_row, min_col, max_col), in either corner order."""
+    m = _RANGE_RE.match(text.strip())
     if not m:
         return None
-    col_letters, row_num = m.groups()
-    col_idx = _col_letters_to_index(col_letters)
-    row_idx = int(row_num) - 1
-    value = sh.cell_value(row_idx, col_idx)
+    c1, r1, c2, r2 = m.groups()
+    rows = sorted((int(r1), int(r2)))
+    cols = sorted((_col_letters_to_index(c1) + 1, _col_letters_to_index(c2) + 1))
+    if rows[0] < 1:
+        return None
+    return rows[0], rows[1], cols[0], cols[1]
+
+def col_index_to_letters(idx: int) -> str:
+    """Convert a 0-based column index to Excel letters (e.g., 2 -> 'C')."""
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def format_value(value):
+    """Render a raw cell value the way the bot displays it."""
     if isinstance(value, (int, float)):
         return f"R{value:,.2f}"
     return value
+
+def _resolve_xlsx(file_path: Path, sheet_name: str, cell_coord: str, value):
+    """Finish an .xlsx read given what the XML stream found for the cell."""
+    # The stream only returns None for cells without a formula; no need to evaluate those
+    needs_eval = value is xlsx_stream.MISS
+    if value is xlsx_stream.MISS:
+        with workbook(file_path) as wb:
+            value = wb[sheet_name][cell_coord].value
+    if value is None and needs_eval:
+        value = _evaluate_formula(file_path, sheet_name, cell_coord)
+    return value
+
+def _evaluate_formula(file_path: Path, sheet_name: str, cell_coord: str):
+    # Compile only the cell's precedents; fall back to the whole-workbook model
+    try:
+        return lazy_eval.evaluate(file_path, sheet_name, cell_coord)
+    except Exception:  # noqa: BLE001
+        pass
+    # Attempt to evaluate formula offline using a cached xlcalculator model
+    try:
+        return evaluate(file_path, sheet_name, cell_coord.upper())
+    except Exception as e:  # noqa: BLE001
+        return f"{_EVAL_ERROR}{e}"
+
+_EVAL_ERROR = "Error calculating formula: "
+
+def remember_cells(base: tuple, sheet_name: str, coords: list[str], values: list) -> None:
+    """Cache values read elsewhere (in a worker process) if `base` is still the file's current version."""
+    if _results_base(base[0]) != base:
+        return
+    for coord, value in zip(coords, values):
+        if not (isinstance(value, str) and value.startswith(_EVAL_ERROR)):
+            _results.put((*base, sheet_name, coord), value)
+
+@metrics.timed("excel.read_cells")
+def read_cells(file_path: Path, sheet_name: str, coords: list[str]) -> list:
+    """Read several cells of one sheet, opening the workbook (and any formula model) at most once."""
+    return read_cells_versioned(file_path, sheet_name, coords)[1]
+
+def read_cells_versioned(file_path: Path, sheet_name: str, coords: list[str]) -> tuple[tuple, list]:
+    """`read_cells`, plus the (path, mtime_ns, size) the values were read at, for `remember_cells`."""
+    base = _results_base(file_path)
+    formatted: dict[str, object] = {}
+    for coord in coords:
+        value = _results.get((*base, sheet_name, coord), _MISSING)
+        if value is not _MISSING:
+            formatted[coord] = value
+    values = _read_raw(file_path, sheet_name, [c for c in coords if c not in formatted])
+    for coord, value in values.items():
+        formatted[coord] = value = format_value(value)
+        # A failed evaluation may be transient (e.g. memory pressure): don't pin it
+        if not (isinstance(value, str) and value.startswith(_EVAL_ERROR)):
+            _results.put((*base, sheet_name, coord), value)
+    return base, [formatted[c] for c in coords]
+
+@metrics.timed("excel.read_values")
+def read_values(file_path: Path, sheet_name: str, coords: list[str]) -> list:
+    """Like `read_cells`, but raw values (numbers stay numbers) and nothing is cached."""
+    values = _read_raw(file_path, sheet_name, coords)
+    return [values[c] for c in coords]
+
+def _read_raw(file_path: Path, sheet_name: str, coords: list[str]) -> dict[str, object]:
+    values: dict[str, object] = {}
+    parsed: dict[str, tuple[int, int]] = {}
+    for coord in coords:
+        m = _CELL_RE.match(coord)
+        if not m:
+            continue
+        col_letters, row_num = m.groups()
+        parsed[coord] = (int(row_num) - 1, _col_letters_to_index(col_letters))
+        # Precomputed index first; it answers MISS while missing or being rebuilt
+        value = cell_index.lookup(file_path, sheet_name, parsed[coord][0] + 1, parsed[coord][1] + 1)
+        if value is not cell_index.MISS:
+            values[coord] = value
+    pending = [c for c in coords if c not in values]
+
+    if pending and file_path.suffix.lower() == ".xlsx":
+        # Fast path: one pass over the sheet XML, stopping after the last requested row
+        streamed = xlsx_stream.read_values(file_path, sheet_name, pending)
+        for coord in pending:
+            values[coord] = _resolve_xlsx(file_path, sheet_name, coord, streamed[coord])
+    elif pending:
+        # .xls via xlrd
+        with workbook(file_path) as wb:
+            sh = wb.sheet_by_name(sheet_name)
+            for coord in pending:
+                if coord not in parsed:
+                    values[coord] = None
+                    continue
+                row, col = parsed[coord]
+                # Past the used range is blank, as xlrd reports empty cells inside it
+                values[coord] = sh.cell_value(row, col) if row < sh.nrows and col < sh.ncols else ""
+    return values
+
+@metrics.timed("excel.read_cell")
+def read_cell(file_path: Path, sheet_name: str, cell_coord: str):
+    """Read a cell value. For .xlsx, try to resolve formulas using data_only; if empty, try xlcalculator."""
+    return read_cells(file_path, sheet_name, [cell_coord])[0]
+
+@metrics.timed("excel.read_range")
+def read_range(file_path: Path, sheet_name: str, min_row: int, max_row: int, min_col: int, max_col: int) -> list[list]:
+    """Read a rectangular block (1-based, inclusive) in one pass; returns formatted rows."""
+    if file_path.suffix.lower() == ".xlsx":
+        with workbook(file_path) as wb:
+            rows = [
+                list(row) + [None] * (max_col - min_col + 1 - len(row))
+                for row in wb[sheet_name].iter_rows(min_row, max_row, min_col, max_col, values_only=True)
+            ]
+        rows += [[None] * (max_col - min_col + 1) for _ in range(max_row - min_row + 1 - len(rows))]
+        # Blank cells may be formulas without a cached result: one more bounded pass tells which
+        blanks = {
+            f"{col_index_to_letters(min_col - 1 + c)}{min_row + r}": (r, c)
+            for r, row in enumerate(rows) for c, value in enumerate(row) if value is None
+        }
+        if blanks:
+            streamed = xlsx_stream.read_values(file_path, sheet_name, list(blanks))
+            for coord, (r, c) in blanks.items():
+                if streamed[coord] is xlsx_stream.MISS:
+                    rows[r][c] = _evaluate_formula(file_path, sheet_name, coord)
+        return [[format_value(v) for v in row] for row in rows]
+
+    # .xls via xlrd: cells past the used range are blank
+    width = max_col - min_col + 1
+    result: list[list] = []
+    with workbook(file_path) as wb:
+        sh = wb.sheet_by_name(sheet_name)
+        for r in range(min_row - 1, max_row):
+            if r < sh.nrows:
+                row = sh.row_values(r, min_col - 1, max_col)
+            else:
+                row = []
+            result.append([format_value(v) for v in row] + [""] * (width - len(row)))
+    return result
+
+def iter_range(file_path: Path, sheet_name: str, min_row: int, max_row: int, min_col: int, max_col: int) -> Iterator[list]:
+    """Raw values of a rectangular block (1-based, inclusive), one row at a time.
+
+    Unlike `read_range`, nothing is held beyond the current row, so blocks of any
+    size can be streamed out; the sheet is read in a single pass.
+    """
+    width = max_col - min_col + 1
+    row_num = min_row - 1
+    if file_path.suffix.lower() == ".xlsx":
+        with workbook(file_path) as wb:
+            sheet = wb[sheet_name]
+            # Formulas without a cached result read as blank; the XML stream, walked in step, marks them MISS
+            misses = ((r, c) for r, c, v in xlsx_stream.iter_cells(file_path, sheet_name) if v is xlsx_stream.MISS)
+            miss = next(misses, None)
+            for row_num, row in enumerate(sheet.iter_rows(min_row, max_row, min_col, max_col, values_only=True), min_row):
+                values = list(row) + [None] * (width - len(row))
+                while miss is not None and miss[0] <= row_num:
+                    r, c = miss
+                    if r == row_num and min_col <= c <= max_col and values[c - min_col] is None:
+                        values[c - min_col] = _evaluate_formula(file_path, sheet_name, f"{col_index_to_letters(c - 1)}{r}")
+                    miss = next(misses, None)
+                yield values
+    else:
+        with workbook(file_path) as wb:
+            sh = wb.sheet_by_name(sheet_name)
+            for row_num in range(min_row, min(max_row, sh.nrows) + 1):
+                row = sh.row_values(row_num - 1, min_col - 1, max_col)
+                yield row + [None] * (width - len(row))
+    # Past the last used row everything is blank
+    for _ in range(row_num, max_row):
+        yield [None] * width
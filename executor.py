@@ -0,0 +1,105 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Hashable
+
+from .config import IO_MAX_WORKERS, IO_PER_FILE_CONCURRENCY
+from . import excel, workers
+
+# Blocking spreadsheet and SQLite work runs here so the event loop stays responsive
+_pool = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix="gridbot-io")
+
+# In-flight computations by key; identical concurrent requests await the same task
+_inflight: dict[Hashable, asyncio.Task] = {}
+
+# Per-file queues: at most IO_PER_FILE_CONCURRENCY jobs touch one workbook at a time
+_file_slots: dict[Path, asyncio.Semaphore] = {}
+
+def _slot(file_path: Path) -> asyncio.Semaphore:
+    sem = _file_slots.get(file_path)
+    if sem is None:
+        sem = _file_slots[file_path] = asyncio.Semaphore(IO_PER_FILE_CONCURRENCY)
+    return sem
+
+async def run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` on the I/O pool and await the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, fn, *args)
+
+async def run_for_file(file_path: Path, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` queued behind other jobs for `file_path` (in its worker process, if any); never shared."""
+    async with _slot(file_path):
+        if workers.enabled():
+            return await workers.submit(file_path, fn, *args)
+        return await run_blocking(fn, *args)
+
+async def run_coalesced(key: Hashable, file_path: Path, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` queued behind other jobs for `file_path`; concurrent calls with the same key share one run.
+
+    With WORKER_PROCESSES set, the job runs in the worker process that owns `file_path`.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(run_for_file(file_path, fn, *args))
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    # shield: one caller giving up must not cancel the work for everyone else
+    return await asyncio.shield(task)
+
+# ---------- Spreadsheet helpers used by the handlers ----------
+
+async def list_excel_files(folder: Path) -> list[Path]:
+    return await run_coalesced(("files", folder), folder, excel.list_excel_files, folder)
+
+async def list_sheets(file_path: Path) -> list[str]:
+    return await run_coalesced(("sheets", file_path), file_path, excel.list_sheets, file_path)
+
+def _cached(file_path: Path, sheet_name: str, coords: list[str]) -> list | None:
+    # Answered on the loop itself: a stat() and dict lookups are cheaper than a pool hop
+    try:
+        return excel.cached_cells(file_path, sheet_name, coords)
+    except OSError:
+        return None  # missing file: let the pool path raise as usual
+
+async def read_cell(file_path: Path, sheet_name: str, cell_coord: str):
+    coord = cell_coord.upper()
+    cached = _cached(file_path, sheet_name, [coord])
+    if cached is not None:
+        return cached[0]
+    if workers.enabled():
+        return (await read_cells(file_path, sheet_name, [coord]))[0]
+    return await run_coalesced(("cell", file_path, sheet_name, coord), file_path, excel.read_cell, file_path, sheet_name, coord)
+
+async def read_cells(file_path: Path, sheet_name: str, coords: list[str]) -> list:
+    coords = [c.upper() for c in coords]
+    cached = _cached(file_path, sheet_name, coords)
+    if cached is not None:
+        return cached
+    key = ("cells", file_path, sheet_name, tuple(coords))
+    if not workers.enabled():
+        return await run_coalesced(key, file_path, excel.read_cells, file_path, sheet_name, coords)
+    base, values = await run_coalesced(key, file_path, excel.read_cells_versioned, file_path, sheet_name, coords)
+    # Keep a copy in this process too, so asking again skips the round trip
+    excel.remember_cells(base, sheet_name, coords, values)
+    return values
+
+async def read_range(file_path: Path, sheet_name: str, min_row: int, max_row: int, min_col: int, max_col: int) -> list[list]:
+    key = ("range", file_path, sheet_name, min_row, max_row, min_col, max_col)
+    return await run_coalesced(key, file_path, excel.read_range, file_path, sheet_name, min_row, max_row, min_col, max_col)
@@ -0,0 +1,114 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""/export: favourites or a range as a CSV or XLSX document.
+
+Rows are streamed from the source sheet straight into a temporary file (XLSX via
+openpyxl's write-only mode), so memory stays flat however large the export.
+Values are exported raw: numbers and dates stay numbers and dates.
+"""
+
+from __future__ import annotations
+import csv
+import datetime
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from .excel import iter_range, read_values
+
+FORMATS = ("csv", "xlsx")
+
+def _xlsx_rows(ws, rows: Iterable[list]) -> Iterator[list]:
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    def cell(value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, datetime.date, datetime.time)):
+            return value
+        text = ILLEGAL_CHARACTERS_RE.sub("", str(value))
+        if text.startswith("="):
+            # Text that looks like a formula must stay text
+            c = WriteOnlyCell(ws, text)
+            c.data_type = "s"
+            return c
+        return text
+
+    for row in rows:
+        yield [cell(v) for v in row]
+
+# Text starting with these is run as a formula when a CSV file is opened in a spreadsheet
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _csv_row(row: list) -> list:
+    # Keep such text inert with a leading apostrophe, as spreadsheets do for text typed that way
+    return [
+        "" if v is None else f"'{v}" if isinstance(v, str) and v.startswith(_FORMULA_PREFIXES) else v
+        for v in row
+    ]
+
+def write_rows(rows: Iterable[list], fmt: str, header: list[str] | None = None) -> Path:
+    """Write rows to a new temporary file as `fmt`; the caller deletes it."""
+    fd, name = tempfile.mkstemp(prefix="gridbot-", suffix=f".{fmt}")
+    path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if fmt == "csv":
+                # BOM so Excel opens UTF-8 text correctly
+                text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+                writer = csv.writer(text)
+                if header:
+                    writer.writerow(header)
+                writer.writerows(_csv_row(row) for row in rows)
+                text.flush()
+                text.detach()
+            else:
+                from openpyxl import Workbook
+                wb = Workbook(write_only=True)
+                ws = wb.create_sheet("Export")
+                for row in _xlsx_rows(ws, [header] if header else []):
+                    ws.append(row)
+                for row in _xlsx_rows(ws, rows):
+                    ws.append(row)
+                wb.save(out)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
+
+def export_range(file_path: Path, sheet_name: str, bounds: tuple[int, int, int, int], fmt: str) -> Path:
+    """A block of one sheet (min_row, max_row, min_col, max_col), as laid out in the sheet."""
+    return write_rows(iter_range(file_path, sheet_name, *bounds), fmt)
+
+def favourite_rows(favs: list[tuple]) -> Iterator[list]:
+    """(nickname, file, sheet, cell, value) per favourite; each (file, sheet) is read once."""
+    groups: dict[tuple[str, str], list[tuple]] = {}
+    for fav in favs:
+        groups.setdefault((fav[2], fav[3]), []).append(fav)
+    values: dict[int, Any] = {}
+    for (file_path, sheet_name), items in groups.items():
+        try:
+            read = read_values(Path(file_path), sheet_name, [cell.upper() for (*_rest, cell) in items])
+        except Exception as e:  # noqa: BLE001
+            read = [f"Error reading {Path(file_path).name}: {e}"] * len(items)
+        values.update((item[0], value) for item, value in zip(items, read))
+    for fav_id, nickname, file_path, sheet_name, cell_coord in favs:
+        yield [nickname, Path(file_path).name, sheet_name, cell_coord, values[fav_id]]
+
+def export_favourites(favs: list[tuple], fmt: str) -> Path:
+    return write_rows(favourite_rows(favs), fmt, ["Favourite", "File", "Sheet", "Cell", "Value"])
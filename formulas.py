@@ -0,0 +1,110 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+from .cache import LRUCache, KeyedLocks, FileVersion, file_version
+from .config import MODEL_CACHE_MAX_ENTRIES, MODEL_CACHE_DIR
+from . import metrics
+
+class _CompiledModel:
+    """An xlcalculator evaluator plus a lock; evaluators are not thread-safe."""
+
+    __slots__ = ("evaluator", "lock")
+
+    def __init__(self, evaluator) -> None:
+        self.evaluator = evaluator
+        self.lock = threading.Lock()
+
+# Keyed by (resolved path, mtime_ns, size)
+_models = LRUCache(MODEL_CACHE_MAX_ENTRIES)
+metrics.register_cache("formula_models", _models)
+_compile_locks = KeyedLocks()
+
+def _disk_prefix(path: Path) -> str:
+    return hashlib.sha1(path.as_posix().encode("utf-8")).hexdigest()
+
+def _disk_file(path: Path, version: FileVersion) -> Path:
+    mtime_ns, size = version
+    return Path(MODEL_CACHE_DIR) / f"{_disk_prefix(path)}-{mtime_ns}-{size}.json.gz"
+
+def _load_from_disk(path: Path, version: FileVersion):
+    from xlcalculator import Model
+    fname = _disk_file(path, version)
+    if not fname.exists():
+        return None
+    model = Model()
+    try:
+        model.construct_from_json_file(fname.as_posix(), build_code=True)
+    except Exception:  # noqa: BLE001
+        # Corrupt or written by an incompatible xlcalculator; recompile
+        fname.unlink(missing_ok=True)
+        return None
+    return model
+
+def _save_to_disk(path: Path, version: FileVersion, model) -> None:
+    folder = Path(MODEL_CACHE_DIR)
+    folder.mkdir(parents=True, exist_ok=True)
+    # Older versions of this workbook are never needed again
+    for old in folder.glob(f"{_disk_prefix(path)}-*.json.gz"):
+        old.unlink(missing_ok=True)
+    target = _disk_file(path, version)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp.gz")
+    try:
+        model.persist_to_json_file(tmp.as_posix())
+        os.replace(tmp, target)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+@metrics.timed("formulas.compile")
+def _compile(path: Path, version: FileVersion) -> _CompiledModel:
+    from xlcalculator import ModelCompiler, Evaluator
+    model = _load_from_disk(path, version) if MODEL_CACHE_DIR else None
+    if model is None:
+        model = ModelCompiler().read_and_parse_archive(path.as_posix())
+        if MODEL_CACHE_DIR:
+            _save_to_disk(path, version, model)
+    return _CompiledModel(Evaluator(model))
+
+def get_model(file_path: Path) -> _CompiledModel:
+    """Return the compiled model for the current version of `file_path`, compiling at most once."""
+    path = file_path.resolve()
+    version = file_version(path)
+    key = (path, *version)
+    compiled = _models.get(key)
+    if compiled is not None:
+        return compiled
+    with _compile_locks(path):
+        compiled = _models.get(key)
+        if compiled is not None:
+            return compiled
+        _models.discard_where(lambda k: k[0] == path)
+        compiled = _compile(path, version)
+        _models.put(key, compiled)
+        return compiled
+
+@metrics.timed("formulas.evaluate_model")
+def evaluate(file_path: Path, sheet_name: str, cell_coord: str) -> Any:
+    """Evaluate one cell with xlcalculator, unwrapping its Number/Text/Boolean types."""
+    compiled = get_model(file_path)
+    with compiled.lock:
+        value = compiled.evaluator.evaluate(f"{sheet_name}!{cell_coord}")
+    return getattr(value, "value", value)
@@ -15,6 +15,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
+import asyncio
+import html
 import re
 from pathlib import Path
 from typing import Iterable
@@ -23,17 +25,24 @@ from telegram import (
     Update,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
 )
 from telegram.ext import ContextTypes
 
-from .config import AUTHORIZED_USERS, EXCEL_FOLDER
-from .state import set_state, get_state, clear_state
-from .excel import list_excel_files, list_sheets, read_cell
+from .config import ADMIN_USERS, AUTHORIZED_USERS, INLINE_BUDGET_MS
+from . import alerts, autocomplete, export, metrics, search
+from .state import Session, set_state, aget_state, clear_state
+from .excel import col_index_to_letters, parse_range
+from .executor import list_sheets, read_cell, read_cells, read_range, run_blocking, run_for_file
+from .watcher import FolderSnapshot, folder_watcher
 from .database import (
-    get_favourites,
-    get_favourite_by_id,
-    add_favourite,
-    favourite_exists,
+    aget_favourites,
+    ahas_favourites,
+    aget_favourite_by_id,
+    aadd_favourite,
+    afavourite_exists,
+    aset_subscribed,
 )
 
 # ---------- UI helpers ----------
@@ -47,6 +56,7 @@ def _menu_kb(has_favs: bool) -> InlineKeyboardMarkup:
     ]
     if has_favs:
         rows.append([InlineKeyboardButton("⭐ Select from favourites", callback_data="menu:favs")])
+        rows.append([InlineKeyboardButton("📋 Read all favourites", callback_data="menu:allfavs")])
     rows.append([InlineKeyboardButton("❌ Exit", callback_data="exit")])
     return InlineKeyboardMarkup(rows)
 
@@ -59,6 +69,126 @@ def _list_kb(prefix: str, labels: list[str]) -> InlineKeyboardMarkup:
     rows.append([InlineKeyboardButton("❌ Exit", callback_data="exit")])
     return InlineKeyboardMarkup(rows)
 
+# Telegram rejects text messages longer than this
+_MAX_MESSAGE = 4096
+
+def _escape_clipped(text: str, limit: int) -> str:
+    """html.escape(text) in at most `limit` characters, shortened before escaping so no entity is cut."""
+    escaped = html.escape(text)
+    if len(escaped) <= limit:
+        return escaped
+    parts, size = [], len("…")
+    for ch in text:
+        part = html.escape(ch)
+        if size + len(part) > limit:
+            break
+        parts.append(part)
+        size += len(part)
+    return "".join(parts) + "…"
+
+def _chunk_lines(lines: list[str], limit: int = _MAX_MESSAGE) -> list[str]:
+    """Join lines, each already shorter than `limit`, into as few messages as fit under it."""
+    chunks: list[str] = []
+    current = ""
+    for line in lines:
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+# Widest a single table column may get before values are truncated
+_MAX_COL_WIDTH = 18
+
+def _render_table(header: list[str], rows: list[list], max_width: int = _MAX_COL_WIDTH) -> list[str]:
+    """Render rows as monospace <pre> tables, split (repeating the header) to fit one message each.
+
+    Tables too wide for a message are split into bands of columns, each repeating the first column.
+    """
+    def cell(v) -> str:
+        text = "" if v is None else str(v)
+        return text if len(text) <= max_width else text[:max_width - 1] + "…"
+
+    body = [[cell(v) for v in row] for row in rows]
+    widths = [max(len(r[i]) for r in [header, *body]) for i in range(len(header))]
+
+    # Escaped length of every padded cell; a band's lines may take half a message, leaving room for the header
+    sizes = [[len(html.escape(v)) + w - len(v) for v, w in zip(r, widths)] for r in [header, *body]]
+    budget = (_MAX_MESSAGE - len("<pre></pre>") - 1) // 2
+    bands: list[list[int]] = []
+    band, used = [0], [r[0] for r in sizes]
+    for i in range(1, len(header)):
+        grown = [u + 1 + r[i] for u, r in zip(used, sizes)]
+        if len(band) > 1 and max(grown) > budget:
+            bands.append(band)
+            band, grown = [0], [r[0] + 1 + r[i] for r in sizes]
+        band.append(i)
+        used = grown
+    bands.append(band)
+
+    def line(values: list[str], band: list[int]) -> str:
+        return html.escape(" ".join(values[i].ljust(widths[i]) for i in band).rstrip())
+
+    tables = []
+    for band in bands:
+        head = line(header, band)
+        limit = _MAX_MESSAGE - len("<pre></pre>") - len(head) - 1
+        tables += [f"<pre>{head}\n{chunk}</pre>" for chunk in _chunk_lines([line(r, band) for r in body], limit)]
+    return tables
+
+async def _folder_snapshot() -> FolderSnapshot | None:
+    """In-memory folder listing; only the very first call after startup waits for the scan."""
+    snap = folder_watcher.snapshot()
+    if snap is None:
+        snap = await run_blocking(folder_watcher.wait)
+    return snap
+
+async def _read_favourites(favs: list[tuple]) -> list[str]:
+    """Format every favourite's value, reading each (file, sheet) once and the groups in parallel."""
+    groups: dict[tuple[str, str], list[tuple]] = {}
+    for fav in favs:
+        groups.setdefault((fav[2], fav[3]), []).append(fav)
+
+    async def read_group(file_path: str, sheet_name: str, items: list[tuple]) -> dict[int, object]:
+        try:
+            values = await read_cells(Path(file_path), sheet_name, [cell for (*_rest, cell) in items])
+        except Exception as e:  # noqa: BLE001
+            values = [f"Error reading {Path(file_path).name}: {e}"] * len(items)
+        return {item[0]: value for item, value in zip(items, values)}
+
+    results: dict[int, object] = {}
+    for part in await asyncio.gather(*(read_group(fp, sh, items) for (fp, sh), items in groups.items())):
+        results.update(part)
+    return [
+        f"<b>{_escape_clipped(nickname, 500)}</b> ({_escape_clipped(f'{sheet_name}!{cell_coord}', 500)}): "
+        f"{_escape_clipped(str(results[fav_id]), 2000)}"
+        for (fav_id, nickname, _fp, sheet_name, cell_coord) in favs
+    ]
+
+# Larger blocks would take many messages; ask users to narrow them down instead
+_MAX_BLOCK_CELLS = 2000
+
+async def _read_block(file_path: Path, sheet_name: str, text: str) -> list[str] | None:
+    """Read a range or comma-separated cell list as rendered tables; None if `text` is neither."""
+    bounds = parse_range(text)
+    if bounds:
+        min_row, max_row, min_col, max_col = bounds
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > _MAX_BLOCK_CELLS:
+            return [html.escape(f"That range is too large; please request at most {_MAX_BLOCK_CELLS} cells.")]
+        rows = await read_range(file_path, sheet_name, min_row, max_row, min_col, max_col)
+        header = [""] + [col_index_to_letters(c - 1) for c in range(min_col, max_col + 1)]
+        return _render_table(header, [[min_row + i, *row] for i, row in enumerate(rows)])
+
+    coords = [c.strip().upper() for c in text.split(",") if c.strip()]
+    if len(coords) < 2 or not all(_CELL_RE.match(c) for c in coords):
+        return None
+    if len(coords) > _MAX_BLOCK_CELLS:
+        return [html.escape(f"Please request at most {_MAX_BLOCK_CELLS} cells.")]
+    values = await read_cells(file_path, sheet_name, coords)
+    return _render_table(["Cell", "Value"], [[c, v] for c, v in zip(coords, values)])
+
 # ---------- Auth ----------
 
 async def _check_auth(update: Update) -> bool:
@@ -68,6 +198,8 @@ async def _check_auth(update: Update) -> bool:
             await update.message.reply_text("Sorry, you are not authorized to use this bot.")
         elif update.callback_query:
             await update.callback_query.answer("Not authorized", show_alert=True)
+        elif update.inline_query:
+            await update.inline_query.answer([], cache_time=0, is_personal=True)
         return False
     return True
 
@@ -78,9 +210,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     uid = update.effective_user.id
     set_state(uid, "main_menu")
-    favs = get_favourites(uid)
+    has_favs = await ahas_favourites(uid)
     text = "Choose an option:"
-    kb = _menu_kb(has_favs=bool(favs))
+    kb = _menu_kb(has_favs=has_favs)
     if update.message:
         await update.message.reply_text(text, reply_markup=kb)
     else:
@@ -98,10 +230,205 @@ async def exit_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     else:
         await update.callback_query.edit_message_text(msg)
 
+@metrics.timed("command.all")
+async def all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Reply with the values of all of the user's favourites in one message."""
+    if not await _check_auth(update):
+        return
+    uid = update.effective_user.id
+    favs = await aget_favourites(uid)
+    if not favs:
+        await update.message.reply_text("No favourites saved yet.", reply_markup=_menu_kb(False))
+        set_state(uid, "main_menu")
+        return
+    for chunk in _chunk_lines(await _read_favourites(favs)):
+        await update.message.reply_text(chunk, parse_mode="HTML")
+    set_state(uid, "main_menu")
+    await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=True))
+
+# Bigger exports take long enough that the user is better off opening the workbook
+_MAX_EXPORT_CELLS = 1_000_000
+
+def _export_name(*parts: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", "-".join(parts)).strip("_")
+
+@metrics.timed("command.export")
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export [csv|xlsx]: favourites as a file; /export B2:F40 [csv|xlsx]: a range of the sheet being browsed."""
+    if not await _check_auth(update):
+        return
+    uid = update.effective_user.id
+    args = context.args or []
+    fmt = next((a.lower() for a in args if a.lower() in export.FORMATS), "csv")
+    ranges = [a for a in args if a.lower() not in export.FORMATS]
+
+    if ranges:
+        st = await aget_state(uid)
+        bounds = parse_range(ranges[0])
+        if not st or not st.file or not st.sheet:
+            await update.message.reply_text(
+                "Pick a file and a sheet first (📂 Select from Excel files), then send e.g. /export B2:F40 xlsx."
+            )
+            return
+        if not bounds:
+            await update.message.reply_text("Usage: /export B2:F40 [csv|xlsx] — or /export [csv|xlsx] for your favourites.")
+            return
+        min_row, max_row, min_col, max_col = bounds
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > _MAX_EXPORT_CELLS:
+            await update.message.reply_text(f"Please export at most {_MAX_EXPORT_CELLS:,} cells at a time.")
+            return
+        try:
+            path = await run_for_file(st.file, export.export_range, st.file, st.sheet, bounds, fmt)
+        except Exception as e:  # noqa: BLE001
+            # Sheet renamed or removed, workbook unreadable or mid-write
+            await update.message.reply_text(f"Error reading {st.file.name}: {e}")
+            return
+        filename = _export_name(st.file.stem, st.sheet, ranges[0].upper().replace(":", "-")) + f".{fmt}"
+    else:
+        favs = await aget_favourites(uid)
+        if not favs:
+            await update.message.reply_text("No favourites saved yet.", reply_markup=_menu_kb(False))
+            return
+        path = await run_blocking(export.export_favourites, favs, fmt)
+        filename = f"favourites.{fmt}"
+    try:
+        with open(path, "rb") as f:
+            await update.message.reply_document(f, filename=filename)
+    finally:
+        path.unlink(missing_ok=True)
+
+@metrics.timed("command.find")
+async def find_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/find <text>: cells in any workbook whose value contains words starting with <text>."""
+    if not await _check_auth(update):
+        return
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text(
+            'Usage: /find <text> — e.g. /find revenue, /find 1250 or /find "total" for whole words only.'
+        )
+        return
+    results = await run_blocking(search.find, query)
+    if not results:
+        await update.message.reply_text(f"No cells match “{query}” (new or changed files may still be indexing).")
+        return
+    for table in _render_table(["File", "Sheet", "Cell", "Value"], [list(r) for r in results]):
+        await update.message.reply_text(table, parse_mode="HTML")
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin only: latency percentiles, error rates and cache hit ratios since start."""
+    if update.effective_user.id not in ADMIN_USERS:
+        await update.message.reply_text("Sorry, /stats is for admins only.")
+        return
+    ops = [
+        [op, count, f"{err:.1f}%", f"{p50:.1f}", f"{p90:.1f}", f"{p99:.1f}"]
+        for op, count, err, p50, p90, p99 in metrics.op_rows()
+    ]
+    caches = [[name, hits, misses, f"{ratio:.1f}%"] for name, hits, misses, ratio in metrics.cache_rows()]
+    if not ops and not caches:
+        await update.message.reply_text("No measurements yet.")
+        return
+    # Operation names are the point of the table: don't truncate them
+    tables = _render_table(["Operation", "Count", "Errors", "p50 ms", "p90 ms", "p99 ms"], ops, 40) if ops else []
+    tables += _render_table(["Cache", "Hits", "Misses", "Hit rate"], caches, 40) if caches else []
+    for table in tables:
+        await update.message.reply_text(table, parse_mode="HTML")
+
+# ---------- Inline mode ----------
+
+# Per kind (favourites, sheets); Telegram shows at most 50 results
+_INLINE_RESULTS = 20
+_INLINE_COORD_RE = re.compile(r"^[A-Za-z]{1,3}\d+$")
+_PENDING = object()
+
+async def _values_within(reads: list[tuple[Path, str, str]], budget: float) -> list:
+    """Cell values, or _PENDING for reads that didn't finish in `budget` seconds.
+
+    Unfinished reads keep going, so the next keystroke finds them cached.
+    """
+    tasks = [asyncio.ensure_future(read_cell(*r)) for r in reads]
+    for task in tasks:
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    if tasks:
+        await asyncio.wait(tasks, timeout=budget)
+
+    def outcome(task: asyncio.Future):
+        if not task.done():
+            return _PENDING
+        return "(unavailable)" if task.exception() else task.result()
+    return [outcome(t) for t in tasks]
+
+@metrics.timed("inline_query")
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`@bot <words> [cell]`: favourites by nickname and sheets by file/sheet name, with values."""
+    if not await _check_auth(update):
+        return
+    uid = update.effective_user.id
+    text = update.inline_query.query.strip()
+    tokens = text.split()
+    # "sales jan C3": the last word is a cell to read from the matching sheets
+    coord = tokens[-1].upper() if len(tokens) > 1 and _INLINE_COORD_RE.match(tokens[-1]) else None
+
+    # A trailing cell only picks the cell to show for matching sheets; it isn't part of any name
+    words = " ".join(tokens[:-1]) if coord else text
+    favs = (await autocomplete.favourite_index(uid)).find(words, _INLINE_RESULTS)
+    sheets = autocomplete.sheet_index().find(words, _INLINE_RESULTS) if text else []
+    reads = [(Path(fp), sh, cell) for _id, _nick, fp, sh, cell in favs]
+    if coord:
+        reads += [(path, sh, coord) for path, sh in sheets]
+    values = await _values_within(reads, INLINE_BUDGET_MS / 1000)
+
+    results = []
+    for (fav_id, nickname, _fp, sheet_name, cell_coord), value in zip(favs, values):
+        where = f"{sheet_name}!{cell_coord}"
+        ready = value is not _PENDING
+        results.append(InlineQueryResultArticle(
+            id=f"fav:{fav_id}",
+            title=f"⭐ {nickname}",
+            description=f"{where}: {value}" if ready else f"{where} (still reading…)",
+            input_message_content=InputTextMessageContent(
+                f"⭐ {nickname} ({where}): {value}" if ready else f"⭐ {nickname} ({where})"
+            ),
+        ))
+    sheet_values = values[len(favs):] if coord else [None] * len(sheets)
+    for i, ((path, sheet_name), value) in enumerate(zip(sheets, sheet_values)):
+        if coord:
+            ready = value is not _PENDING
+            results.append(InlineQueryResultArticle(
+                id=f"cell:{i}:{coord}",
+                title=f"{path.name} › {sheet_name}!{coord}",
+                description=str(value) if ready else "still reading…",
+                input_message_content=InputTextMessageContent(
+                    f"📄 {path.name} › {sheet_name}!{coord}" + (f": {value}" if ready else "")
+                ),
+            ))
+        else:
+            results.append(InlineQueryResultArticle(
+                id=f"sheet:{i}",
+                title=f"{path.name} › {sheet_name}",
+                description="Add a cell to read it, e.g. … C3",
+                input_message_content=InputTextMessageContent(f"📄 {path.name} › {sheet_name}"),
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(
+                    "🔎 Read a cell", switch_inline_query_current_chat=f"{path.stem} {sheet_name} "
+                )]]),
+            ))
+    # Answers with values still being read mustn't be reused by Telegram
+    pending = any(v is _PENDING for v in values)
+    await update.inline_query.answer(results, cache_time=0 if pending else 5, is_personal=True)
+
 # ---------- Callback router ----------
 
+# Metric names per button; anything else is counted as "unknown" to keep names bounded
+_CALLBACK_OPS = {"exit", "menu:files", "menu:favs", "menu:allfavs", "file", "sheet", "fav", "sub", "unsub"}
+
 async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Single router for all callback buttons."""
+    data = update.callback_query.data or ""
+    op = data if data in _CALLBACK_OPS else data.split(":", 1)[0]
+    with metrics.timer(f"on_callback.{op if op in _CALLBACK_OPS else 'unknown'}"):
+        await _on_callback(update, context)
+
+async def _on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await _check_auth(update):
         return
     q = update.callback_query
@@ -117,12 +444,13 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     # Main menu selections
     if data == "menu:files":
-        files = list_excel_files(EXCEL_FOLDER)
+        snap = await _folder_snapshot()
+        files = snap.files if snap else ()
         if not files:
             await q.edit_message_text("No Excel files found in the configured folder.", reply_markup=_exit_kb())
             set_state(uid, "main_menu")
             return
-        # store list in state to avoid long callback_data
+        # keep (a reference to) the listing in state to avoid long callback_data
         set_state(uid, "choose_file", files=files)
         await q.edit_message_text(
             "Select a file:",
@@ -131,7 +459,7 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     if data == "menu:favs":
-        favs = get_favourites(uid)
+        favs = await aget_favourites(uid)
         if not favs:
             await q.edit_message_text("No favourites saved yet.", reply_markup=_menu_kb(False))
             set_state(uid, "main_menu")
@@ -146,10 +474,24 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await q.edit_message_text("Select a favourite:", reply_markup=InlineKeyboardMarkup(rows))
         return
 
+    if data == "menu:allfavs":
+        favs = await aget_favourites(uid)
+        if not favs:
+            await q.edit_message_text("No favourites saved yet.", reply_markup=_menu_kb(False))
+            set_state(uid, "main_menu")
+            return
+        chunks = _chunk_lines(await _read_favourites(favs))
+        await q.edit_message_text(chunks[0], parse_mode="HTML")
+        for chunk in chunks[1:]:
+            await q.message.reply_text(chunk, parse_mode="HTML")
+        await q.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=True))
+        set_state(uid, "main_menu")
+        return
+
     # File chosen
     if data.startswith("file:"):
-        st = get_state(uid) or {}
-        files: list[Path] = st.get("files", [])
+        st = await aget_state(uid)
+        files = st.files if st and st.files else ()
         try:
             idx = int(data.split(":", 1)[1])
             file_path = files[idx]
@@ -157,19 +499,21 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             await q.edit_message_text("Invalid file selection.", reply_markup=_exit_kb())
             return
 
-        sheets = list_sheets(file_path)
+        snap = folder_watcher.snapshot()
+        known = snap.sheets.get(file_path) if snap else None
+        sheets = known if known is not None else await list_sheets(file_path)
         set_state(uid, "choose_sheet", file=file_path, sheets=sheets)
         await q.edit_message_text(
-            f"Select a sheet from *{file_path.name}*:",
+            f"Select a sheet from <b>{html.escape(file_path.name)}</b>:",
             reply_markup=_list_kb("sheet", sheets),
-            parse_mode="Markdown"
+            parse_mode="HTML"
         )
         return
 
     # Sheet chosen
     if data.startswith("sheet:"):
-        st = get_state(uid) or {}
-        sheets: list[str] = st.get("sheets", [])
+        st = await aget_state(uid)
+        sheets = st.sheets if st and st.sheets else ()
         try:
             idx = int(data.split(":", 1)[1])
             chosen_sheet = sheets[idx]
@@ -177,9 +521,9 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             await q.edit_message_text("Invalid sheet selection.", reply_markup=_exit_kb())
             return
 
-        set_state(uid, "choose_cell", sheet=chosen_sheet, file=st.get("file"))
+        set_state(uid, "choose_cell", file=st.file, sheet=chosen_sheet)
         await q.edit_message_text(
-            "Enter cell coordinate (e.g. C3):",
+            "Enter a cell (e.g. C3), a range (B2:F40) or a list (C3,D7,H12):",
             reply_markup=_exit_kb()
         )
         return
@@ -192,20 +536,49 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             await q.edit_message_text("Invalid favourite selection.", reply_markup=_exit_kb())
             return
 
-        fav = get_favourite_by_id(fav_id)
+        fav = await aget_favourite_by_id(fav_id)
         if not fav:
             await q.edit_message_text("Favourite not found.", reply_markup=_exit_kb())
             return
 
-        _id, nickname, file_path, sheet_name, cell_coord = fav
-        value = read_cell(Path(file_path), sheet_name, cell_coord)
-        await q.edit_message_text(f"Value for *{nickname}* ({sheet_name}!{cell_coord}): {value}", parse_mode="Markdown")
+        _id, nickname, file_path, sheet_name, cell_coord, subscribed = fav
+        value = await read_cell(Path(file_path), sheet_name, cell_coord)
+        toggle = (
+            InlineKeyboardButton("🔕 Stop change alerts", callback_data=f"unsub:{fav_id}")
+            if subscribed else
+            InlineKeyboardButton("🔔 Alert me when it changes", callback_data=f"sub:{fav_id}")
+        )
+        await q.edit_message_text(
+            f"Value for <b>{html.escape(nickname)}</b> ({html.escape(f'{sheet_name}!{cell_coord}')}): "
+            f"{html.escape(str(value))}",
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup([[toggle]]),
+        )
         # Back to main menu
-        favs = get_favourites(uid)
-        await q.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=bool(favs)))
+        has_favs = await ahas_favourites(uid)
+        await q.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=has_favs))
         set_state(uid, "main_menu")
         return
 
+    # Change alerts for a favourite on/off
+    if data.startswith(("sub:", "unsub:")):
+        action, _, raw_id = data.partition(":")
+        fav = await aget_favourite_by_id(int(raw_id)) if raw_id.isdigit() else None
+        if not fav:
+            await q.edit_message_text("Favourite not found.", reply_markup=_exit_kb())
+            return
+        fav_id, nickname, file_path, sheet_name, cell_coord, _subscribed = fav
+        if action == "sub":
+            # Remember what the user saw now; alerts report changes from here on
+            value = await read_cell(Path(file_path), sheet_name, cell_coord)
+            ok = await aset_subscribed(uid, fav_id, True, alerts.stored(value))
+            text = f"🔔 You'll get a message when <b>{html.escape(nickname)}</b> changes (now {html.escape(str(value))})."
+        else:
+            ok = await aset_subscribed(uid, fav_id, False)
+            text = f"🔕 No more alerts for <b>{html.escape(nickname)}</b>."
+        await q.edit_message_text(text if ok else "Favourite not found.", parse_mode="HTML")
+        return
+
     # Unknown callback
     await q.edit_message_text("Sorry, I didn’t understand that action.", reply_markup=_exit_kb())
 
@@ -215,39 +588,53 @@ _CELL_RE = re.compile(r"^[A-Za-z]+\d+$")
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle free text for cell coordinates or nickname."""
+    st = await aget_state(update.effective_user.id)
+    with metrics.timer(f"handle_text.{st.step if st else 'none'}"):
+        await _handle_text(update, context, st)
+
+async def _handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE, st: Session | None) -> None:
     if not await _check_auth(update):
         return
     uid = update.effective_user.id
-    st = get_state(uid)
 
     # No state → show main menu on any text
     if not st:
-        favs = get_favourites(uid)
+        has_favs = await ahas_favourites(uid)
         set_state(uid, "main_menu")
-        await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=bool(favs)))
+        await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=has_favs))
         return
 
-    step = st.get("step")
+    step = st.step
 
     # User typed /exit as text (in case they didn’t press the button)
     if update.message.text.strip().lower() == "/exit":
         await exit_cmd(update, context)
         return
 
-    # Expecting a cell coordinate
+    # Expecting a cell coordinate, a range (B2:F40) or a list (C3,D7,H12)
     if step == "choose_cell":
         coord = update.message.text.strip()
+        file_path: Path = st.file
+        sheet_name: str = st.sheet
         if not _CELL_RE.match(coord):
-            await update.message.reply_text("Invalid cell format. Please enter like C3.", reply_markup=_exit_kb())
+            tables = await _read_block(file_path, sheet_name, coord)
+            if tables is None:
+                await update.message.reply_text(
+                    "Invalid cell format. Please enter like C3, B2:F40 or C3,D7,H12.", reply_markup=_exit_kb()
+                )
+                return
+            for table in tables:
+                await update.message.reply_text(table, parse_mode="HTML")
+            has_favs = await ahas_favourites(uid)
+            set_state(uid, "main_menu")
+            await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=has_favs))
             return
 
-        file_path: Path = st["file"]
-        sheet_name: str = st["sheet"]
-        value = read_cell(file_path, sheet_name, coord)
+        value = await read_cell(file_path, sheet_name, coord)
         await update.message.reply_text(f"Value in {sheet_name}!{coord}: {value}")
 
         # Ask to save favourite if not already there
-        if not favourite_exists(uid, str(file_path), sheet_name, coord):
+        if not await afavourite_exists(uid, str(file_path), sheet_name, coord):
             set_state(uid, "ask_nickname", file=file_path, sheet=sheet_name, cell=coord)
             await update.message.reply_text(
                 "Do you want to save this as a favourite? If yes, type a nickname. If not, press ❌ Exit or /exit.",
@@ -255,25 +642,28 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             )
         else:
             # Back to main menu
-            favs = get_favourites(uid)
+            has_favs = await ahas_favourites(uid)
             set_state(uid, "main_menu")
-            await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=bool(favs)))
+            await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=has_favs))
         return
 
     # Expecting a nickname for favourite
     if step == "ask_nickname":
         nickname = update.message.text.strip()
-        file_path: Path = st["file"]
-        sheet_name: str = st["sheet"]
-        cell: str = st["cell"]
-        add_favourite(uid, nickname, str(file_path), sheet_name, cell)
-        await update.message.reply_text(f"Favourite “{nickname}” saved ✅")
-        favs = get_favourites(uid)
+        file_path: Path = st.file
+        sheet_name: str = st.sheet
+        cell: str = st.cell
+        if await aadd_favourite(uid, nickname, str(file_path), sheet_name, cell):
+            autocomplete.favourites_changed(uid)
+            await update.message.reply_text(f"Favourite “{nickname}” saved ✅")
+        else:
+            await update.message.reply_text(f"Not saved: {sheet_name}!{cell} is already one of your favourites.")
+        has_favs = await ahas_favourites(uid)
         set_state(uid, "main_menu")
-        await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=bool(favs)))
+        await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=has_favs))
         return
 
     # Fallback: show menu
-    favs = get_favourites(uid)
+    has_favs = await ahas_favourites(uid)
     set_state(uid, "main_menu")
-    await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=bool(favs)))
+    await update.message.reply_text("Choose an option:", reply_markup=_menu_kb(has_favs=has_favs))
@@ -0,0 +1,218 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Evaluate one .xlsx formula by compiling only its precedents (its dependency cone).
+
+Starting at the requested cell, formulas are read from the sheet XML, references are
+followed across sheets and through defined names, and only the cells reached are
+handed to xlcalculator. Results of every formula evaluated along the way are
+memoised per workbook version, so later lookups stop at already-known cells.
+"""
+
+from __future__ import annotations
+import re
+import threading
+from pathlib import Path
+from typing import Any
+
+from .cache import LRUCache, KeyedLocks, file_version
+from .config import MODEL_CACHE_MAX_ENTRIES
+from . import metrics, xlsx_stream
+
+class Unsupported(Exception):
+    """The cone can't be built here (whole-column refs, odd names…); use the full model instead."""
+
+# Beyond this many cells a pruned model stops being cheaper than the full one
+_MAX_CONE_CELLS = 200_000
+
+_STRING_LITERAL_RE = re.compile(r'("(?:[^"]|"")*")')
+_NAME_RE = re.compile(r"(?<![\w.!'\]])([A-Za-z_\\][\w.]*)(?![\w(!'\[])")
+_REF_RE = re.compile(r"^(?:[A-Z]+\d+(?::[A-Z]+\d+)?|[A-Z]+:[A-Z]+|\d+:\d+)$")
+_PLAIN_REF_RE = re.compile(r"^(?:'[^']+'|[\w.]+)!\$?[A-Z]+\$?\d+(?::\$?[A-Z]+\$?\d+)?$")
+
+class _WorkbookMemo:
+    """Per-version state: parsed sheets (formula, raw value by coord) and evaluated results by address."""
+
+    __slots__ = ("path", "sheets", "names", "results", "lock")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.sheets: dict[str, dict[str, tuple[str | None, Any]]] = {}
+        self.names = xlsx_stream.defined_names(path)
+        self.results: dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def cell(self, sheet_name: str, coord: str) -> tuple[str | None, Any]:
+        cells = self.sheets.get(sheet_name)
+        if cells is None:
+            try:
+                cells = {
+                    c: (formula, value)
+                    for c, formula, value in xlsx_stream.iter_formula_cells(self.path, sheet_name)
+                }
+            except KeyError as e:
+                raise Unsupported(f"unknown sheet {sheet_name}") from e
+            self.sheets[sheet_name] = cells
+        return cells.get(coord, (None, None))
+
+# Keyed by (resolved path, mtime_ns, size)
+_memos = LRUCache(MODEL_CACHE_MAX_ENTRIES)
+metrics.register_cache("formula_memos", _memos)
+_memo_locks = KeyedLocks()
+
+def _memo(file_path: Path) -> _WorkbookMemo:
+    path = file_path.resolve()
+    key = (path, *file_version(path))
+    memo = _memos.get(key)
+    if memo is not None:
+        return memo
+    with _memo_locks(path):
+        memo = _memos.get(key)
+        if memo is None:
+            _memos.discard_where(lambda k: k[0] == path)
+            memo = _WorkbookMemo(path)
+            _memos.put(key, memo)
+        return memo
+
+def _prepare(formula: str, sheet_name: str, names: dict[tuple[str | None, str], str]) -> str:
+    """Drop $ anchors and inline defined names, leaving string literals untouched."""
+    def name_ref(m: re.Match) -> str:
+        key = m.group(1).lower()
+        ref = names.get((sheet_name, key)) or names.get((None, key))
+        if ref is None:
+            return m.group(0)
+        ref = ref.replace("$", "")
+        if _PLAIN_REF_RE.match(ref):
+            return ref
+        if "#REF!" in ref or "!" in ref:
+            raise Unsupported(f"defined name {m.group(1)} = {ref}")
+        return f"({ref})"  # constant or small expression
+
+    parts = _STRING_LITERAL_RE.split(formula)
+    for i in range(0, len(parts), 2):
+        parts[i] = _NAME_RE.sub(name_ref, parts[i].replace("$", ""))
+    return "".join(parts)
+
+def _expand(ref: str) -> list[str]:
+    from openpyxl.utils.cell import get_column_letter, range_boundaries
+    if ":" not in ref:
+        return [ref]
+    min_col, min_row, max_col, max_row = range_boundaries(ref)
+    if None in (min_col, min_row, max_col, max_row):
+        raise Unsupported(f"whole row/column reference {ref}")
+    if (max_col - min_col + 1) * (max_row - min_row + 1) > _MAX_CONE_CELLS:
+        raise Unsupported(f"range {ref} too large")
+    return [
+        f"{get_column_letter(c)}{r}"
+        for r in range(min_row, max_row + 1)
+        for c in range(min_col, max_col + 1)
+    ]
+
+def _collect(memo: _WorkbookMemo, sheet_name: str, coord: str) -> tuple[dict[str, Any], list[str]]:
+    """Walk precedents from one cell.
+
+    Returns ({address: value or formula}, formula addresses in dependency order), so
+    each formula can be evaluated after everything it references.
+    """
+    from xlcalculator.xltypes import XLFormula
+    cone: dict[str, Any] = {}
+    deps: dict[str, list[str]] = {}
+    stack = [(sheet_name, coord)]
+    while stack:
+        sh, c = stack.pop()
+        addr = f"{sh}!{c}"
+        if addr in cone:
+            continue
+        if addr in memo.results:
+            cone[addr] = memo.results[addr]
+            continue
+        formula, value = memo.cell(sh, c)
+        if formula is None:
+            if value is not None:
+                cone[addr] = value
+            continue
+        text = _prepare(formula, sh, memo.names)
+        cone[addr] = text
+        deps[addr] = []
+        for term in XLFormula(text, sheet_name=sh).terms:
+            term_sheet, _, ref = term.rpartition("!")
+            if not _REF_RE.match(ref):
+                raise Unsupported(f"unresolved reference {term}")
+            for r in _expand(ref):
+                deps[addr].append(f"{term_sheet}!{r}")
+                stack.append((term_sheet, r))
+        if len(cone) > _MAX_CONE_CELLS:
+            raise Unsupported("dependency cone too large")
+
+    # Iterative post-order over formula cells only
+    order: list[str] = []
+    done: set[str] = set()
+    target = f"{sheet_name}!{coord}"
+    if target not in deps:
+        return cone, order
+    visiting = {target}
+    walk = [(target, iter(deps[target]))]
+    while walk:
+        addr, children = walk[-1]
+        for child in children:
+            if child in deps and child not in done:
+                if child in visiting:
+                    raise Unsupported(f"circular reference through {child}")
+                visiting.add(child)
+                walk.append((child, iter(deps[child])))
+                break
+        else:
+            walk.pop()
+            visiting.discard(addr)
+            done.add(addr)
+            order.append(addr)
+    return cone, order
+
+@metrics.timed("formulas.evaluate_cone")
+def evaluate(file_path: Path, sheet_name: str, cell_coord: str) -> Any:
+    """Evaluate one cell from its dependency cone only. Raises Unsupported when it can't."""
+    from xlcalculator import ModelCompiler, Evaluator
+    from xlcalculator.xltypes import XLCell, XLFormula
+    memo = _memo(file_path)
+    coord = cell_coord.upper()
+    target = f"{sheet_name}!{coord}"
+    with memo.lock:
+        if target in memo.results:
+            return memo.results[target]
+        cone, order = _collect(memo, sheet_name, coord)
+        if not order:
+            # Not a formula after all: plain value or blank
+            return cone.get(target)
+        compiler = ModelCompiler()
+        model = compiler.model
+        formulas = set(order)
+        for addr, item in cone.items():
+            if addr in formulas:
+                formula = XLFormula(item, sheet_name=addr.rpartition("!")[0])
+                model.cells[addr] = XLCell(addr, None, formula=formula)
+                model.formulae[addr] = formula
+            else:
+                model.cells[addr] = XLCell(addr, item)
+        compiler.build_ranges()
+        model.build_code()
+        evaluator = Evaluator(model)
+        # Bottom-up: each formula sees its precedents as plain values, which keeps
+        # xlcalculator's recursion shallow even along long dependency chains
+        for addr in order:
+            result = evaluator.evaluate(addr)
+            model.cells[addr].formula.evaluate = False
+            memo.results[addr] = getattr(result, "value", result)
+        return memo.results[target]
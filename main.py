@@ -14,42 +14,147 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-if __name__ == "__main__" and __package__ is None:
+# Run as a script: import the package's modules relatively. Worker processes
+# (WORKER_PROCESSES) re-run this file as __mp_main__, so they need it as well.
+if __name__ in ("__main__", "__mp_main__") and not __package__:
     import sys, os
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     __package__ = "gridbot"
 
+import asyncio
+import time
+_imports_started = time.perf_counter()
+
+from pathlib import Path
+from urllib.parse import urlsplit
+
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     filters,
 )
-from .config import TOKEN
+from telegram.request import BaseRequest
+from .config import (
+    METRICS_HOST,
+    METRICS_PORT,
+    STARTUP_PROFILE,
+    TOKEN,
+    UPDATE_CONCURRENCY,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
 from .database import init_db
-from .handlers import start, exit_cmd, handle_text, on_callback
+from .handlers import (
+    start, exit_cmd, all_cmd, export_cmd, find_cmd, stats_cmd, handle_text, inline_query, on_callback,
+)
+from .updates import PerUserUpdateProcessor
+from .watcher import folder_watcher
+from . import alerts, autocomplete, excel, metrics, prewarm, search, workers
 
-def main() -> None:
-    if not TOKEN:
-        raise RuntimeError("TOKEN is not set. Please set it in your environment or .env file.")
+# Startup phases as (name, seconds), also recorded as startup.<name> in /stats
+_startup: list[tuple[str, float]] = [("imports", time.perf_counter() - _imports_started)]
 
-    init_db()
+def _phase(name: str, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _startup.append((name, elapsed))
+    metrics.observe(f"startup.{name}", elapsed)
+    return result
 
-    app = ApplicationBuilder().token(TOKEN).build()
+def _print_startup_profile() -> None:
+    # Not part of startup any more, but tracked so a slow library upgrade shows up here
+    t0 = time.perf_counter()
+    excel.import_libraries()
+    deferred = time.perf_counter() - t0
+    print("Startup profile (ms):")
+    for name, seconds in _startup:
+        print(f"  {name:<20} {seconds * 1000:8.1f}")
+    print(f"  {'total':<20} {sum(s for _, s in _startup) * 1000:8.1f}")
+    print(f"  {'(deferred imports)':<20} {deferred * 1000:8.1f}")
+    if workers.enabled():
+        # One job through the pool proves the workers can start from this launch mode
+        t0 = time.perf_counter()
+        asyncio.run(workers.submit(Path(__file__), excel.import_libraries))
+        print(f"  {'(worker round trip)':<20} {(time.perf_counter() - t0) * 1000:8.1f}")
+
+def build_app(token: str, request: BaseRequest | None = None, concurrency: int = UPDATE_CONCURRENCY) -> Application:
+    """Application with every handler registered (no background jobs); `request` overrides the HTTP layer."""
+    # Handlers await workbook I/O on a thread pool, so updates run concurrently,
+    # each user's in order. Bot API calls go through a timed request so Telegram
+    # latency shows up in /stats.
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .request(request or metrics.instrumented_request())
+        .get_updates_request(request or metrics.instrumented_request())
+        .concurrent_updates(PerUserUpdateProcessor(concurrency))
+        .build()
+    )
 
     # Commands
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("exit", exit_cmd))
+    app.add_handler(CommandHandler("all", all_cmd))
+    app.add_handler(CommandHandler("export", export_cmd))
+    app.add_handler(CommandHandler("find", find_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
 
     # Buttons / callbacks (single router)
     app.add_handler(CallbackQueryHandler(on_callback))
 
+    # Inline mode: @bot <nickname, file or sheet words> [cell]
+    app.add_handler(InlineQueryHandler(inline_query))
+
     # Text input (cell coordinate / nickname / or show menu)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    return app
+
+def main() -> None:
+    if not TOKEN and not STARTUP_PROFILE:
+        raise RuntimeError("TOKEN is not set. Please set it in your environment or .env file.")
+
+    _phase("init_db", init_db)
+    # Scan EXCEL_FOLDER once in the background, then follow changes incrementally
+    _phase("watcher", folder_watcher.start)
+    # Keep the /find index current for every workbook in the folder
+    _phase("search_index", search.install)
+    autocomplete.install()
+
+    if METRICS_PORT and not STARTUP_PROFILE:
+        metrics.serve(METRICS_HOST, METRICS_PORT)
+    # Spawn the worker processes (if any) while Telegram is being contacted
+    _phase("workers", workers.start)
+
+    app = _phase("build_app", build_app, TOKEN or "0:startup-profile")
+    if STARTUP_PROFILE:
+        _print_startup_profile()
+        workers.stop()
+        return
+
+    # Background jobs
+    prewarm.install(app)
+    alerts.install(app)
 
     print("✅ gridbot is running…")
-    app.run_polling()
+    if WEBHOOK_URL:
+        # Telegram POSTs updates to WEBHOOK_URL; a reverse proxy forwards them to this local server
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=urlsplit(WEBHOOK_URL).path.lstrip("/"),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+        )
+    else:
+        app.run_polling()
+    workers.stop()
 
 if __name__ == "__main__":
     main()
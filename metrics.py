@@ -0,0 +1,220 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""In-process latency histograms, error counts and cache hit ratios.
+
+Each observation is a perf_counter() pair, a bisect and a few integer updates under
+a lock, so instrumentation stays on in production. Operations are named
+"<area>.<op>" (e.g. "excel.read_cells", "on_callback.file"); read them through
+/stats or the optional Prometheus text endpoint (METRICS_PORT).
+"""
+
+from __future__ import annotations
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator, Protocol
+
+# Upper bounds in seconds; anything slower lands in the implicit +Inf bucket
+BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max", "errors")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (the max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+class HitCounter:
+    """Hit/miss counts for caches that aren't an LRUCache (which counts on its own)."""
+
+    __slots__ = ("hits", "misses")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self) -> None:
+        self.hits += 1
+
+    def miss(self) -> None:
+        self.misses += 1
+
+class _HasHits(Protocol):
+    hits: int
+    misses: int
+
+_lock = threading.Lock()
+_histograms: dict[str, Histogram] = {}
+_caches: dict[str, _HasHits] = {}
+
+def observe(op: str, seconds: float, error: bool = False) -> None:
+    with _lock:
+        h = _histograms.get(op)
+        if h is None:
+            h = _histograms[op] = Histogram()
+        h.observe(seconds, error)
+
+@contextmanager
+def timer(op: str) -> Iterator[None]:
+    """Time the block as `op`; an exception escaping it counts as an error."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe(op, time.perf_counter() - t0, error=True)
+        raise
+    observe(op, time.perf_counter() - t0)
+
+def timed(op: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator form of `timer`, for plain and async functions."""
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args: Any, **kwargs: Any) -> Any:
+                with timer(op):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timer(op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def register_cache(name: str, cache: _HasHits) -> None:
+    _caches[name] = cache
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+
+# ---------- Reporting ----------
+
+def op_rows() -> list[tuple[str, int, float, float, float, float]]:
+    """(op, count, error %, p50 ms, p90 ms, p99 ms), sorted by op."""
+    with _lock:
+        items = sorted(_histograms.items())
+        return [
+            (
+                op, h.count, 100.0 * h.errors / h.count if h.count else 0.0,
+                h.quantile(0.5) * 1000, h.quantile(0.9) * 1000, h.quantile(0.99) * 1000,
+            )
+            for op, h in items
+        ]
+
+def cache_rows() -> list[tuple[str, int, int, float]]:
+    """(cache, hits, misses, hit %), sorted by cache name."""
+    rows = []
+    for name, c in sorted(_caches.items()):
+        total = c.hits + c.misses
+        rows.append((name, c.hits, c.misses, 100.0 * c.hits / total if total else 0.0))
+    return rows
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus() -> str:
+    """Everything in the Prometheus text exposition format (version 0.0.4)."""
+    lines = [
+        "# HELP gridbot_op_seconds Latency of instrumented operations.",
+        "# TYPE gridbot_op_seconds histogram",
+    ]
+    errors = ["# HELP gridbot_op_errors_total Operations that raised.", "# TYPE gridbot_op_errors_total counter"]
+    with _lock:
+        for op, h in sorted(_histograms.items()):
+            op = _label(op)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'gridbot_op_seconds_bucket{{op="{op}",le="{bound}"}} {cumulative}')
+            lines.append(f'gridbot_op_seconds_bucket{{op="{op}",le="+Inf"}} {h.count}')
+            lines.append(f'gridbot_op_seconds_sum{{op="{op}"}} {h.sum}')
+            lines.append(f'gridbot_op_seconds_count{{op="{op}"}} {h.count}')
+            errors.append(f'gridbot_op_errors_total{{op="{op}"}} {h.errors}')
+    lines += errors
+    lines += [
+        "# HELP gridbot_cache_requests_total Cache lookups by result.",
+        "# TYPE gridbot_cache_requests_total counter",
+    ]
+    for name, hits, misses, _ratio in cache_rows():
+        lines.append(f'gridbot_cache_requests_total{{cache="{_label(name)}",result="hit"}} {hits}')
+        lines.append(f'gridbot_cache_requests_total{{cache="{_label(name)}",result="miss"}} {misses}')
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass  # scrapes every few seconds would drown the bot's own output
+
+def serve(host: str, port: int) -> ThreadingHTTPServer:
+    """Expose GET /metrics on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="gridbot-metrics", daemon=True).start()
+    return server
+
+def instrumented_request(**kwargs: Any):
+    """An HTTPXRequest that times each Bot API call as "telegram.<method>"."""
+    from telegram.request import HTTPXRequest
+
+    class _TimedRequest(HTTPXRequest):
+        async def do_request(self, url: str, method: str, *args: Any, **kw: Any):
+            with timer(f"telegram.{url.rsplit('/', 1)[-1]}"):
+                return await super().do_request(url, method, *args, **kw)
+
+    return _TimedRequest(**kwargs)
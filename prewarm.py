@@ -0,0 +1,80 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import asyncio
+from pathlib import Path
+
+from telegram.ext import Application, ContextTypes
+
+from .cache import FileVersion
+from .config import PREWARM_CONCURRENCY, WARM_IMPORTS
+from .database import aget_favourite_files, get_favourite_cells
+from .excel import get_workbook, import_libraries, read_cells
+from .executor import run_blocking, run_coalesced
+from .watcher import folder_watcher
+from . import metrics
+
+def warm_file(file_path: Path) -> None:
+    """Load a workbook into the caches by reading its favourited cells (compiling formulas if needed)."""
+    if not file_path.is_file():
+        return
+    get_workbook(file_path)
+    by_sheet: dict[str, list[str]] = {}
+    for sheet_name, cell_coord in get_favourite_cells(str(file_path)):
+        by_sheet.setdefault(sheet_name, []).append(cell_coord.upper())
+    for sheet_name, coords in by_sheet.items():
+        try:
+            read_cells(file_path, sheet_name, coords)
+        except Exception:  # noqa: BLE001
+            # A renamed sheet shouldn't stop the other sheets from warming
+            continue
+
+async def prewarm_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Warm the given files (job data), or every favourited workbook, a few at a time."""
+    favourite_files = set(await aget_favourite_files())
+    wanted = context.job.data or sorted(favourite_files)
+    sem = asyncio.Semaphore(PREWARM_CONCURRENCY)
+
+    async def warm(file_path: str) -> None:
+        if file_path not in favourite_files:
+            return
+        path = Path(file_path)
+        async with sem:
+            try:
+                await run_coalesced(("warm", path), path, warm_file, path)
+            except Exception:  # noqa: BLE001
+                pass
+
+    await asyncio.gather(*(warm(fp) for fp in wanted))
+
+async def import_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import openpyxl, xlrd and xlcalculator off the loop, once the bot is already receiving updates."""
+    with metrics.timer("startup.warm_imports"):
+        await run_blocking(import_libraries)
+
+def install(app: Application) -> None:
+    """Warm favourites shortly after startup, and again for each favourited file that changes."""
+    if WARM_IMPORTS:
+        app.job_queue.run_once(import_job, when=0, name="imports")
+    app.job_queue.run_once(prewarm_job, when=1, name="prewarm")
+
+    def on_change(path: Path, version: FileVersion | None) -> None:
+        # Called from the watcher thread; the job queue is safe to use from there
+        if version is not None:
+            app.job_queue.run_once(prewarm_job, when=0, data=[str(path)], name=f"prewarm:{path.name}")
+
+    folder_watcher.add_listener(on_change)
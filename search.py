@@ -0,0 +1,92 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""/find: which file, sheet and cell holds a value.
+
+The terms live in the cell index (INDEX_DB_PATH), written in the same pass as the
+cell values. The watcher keeps it current: every workbook in EXCEL_FOLDER is
+indexed in the background at startup, re-indexed when it changes and dropped
+when it is deleted.
+"""
+
+from __future__ import annotations
+import threading
+from pathlib import Path
+from typing import Any
+
+from .cache import FileVersion
+from .config import INDEX_DB_PATH
+from .excel import col_index_to_letters, format_value
+from .watcher import folder_watcher
+from . import cell_index
+
+def parse_query(text: str) -> tuple[list[str], bool]:
+    """Words to look for, and whether they must match exactly ("quoted") rather than as prefixes."""
+    text = text.strip()
+    exact = len(text) >= 2 and text[0] == text[-1] == '"'
+    if exact:
+        text = text[1:-1]
+    return sorted(cell_index.terms(text)), exact
+
+# (snapshot version, {indexed path: display name}); recomputed only when the folder changes
+_names: tuple[int, dict[str, str]] = (0, {})
+
+def _present() -> dict[str, str] | None:
+    global _names
+    snap = folder_watcher.snapshot()
+    if snap is None:
+        return None
+    if _names[0] != snap.version:
+        _names = (snap.version, {p.resolve().as_posix(): p.name for p in snap.files})
+    return _names[1]
+
+def find(text: str, limit: int = 20) -> list[tuple[str, str, str, Any]]:
+    """(file name, sheet, cell, value) of cells matching the query, for workbooks still in the folder."""
+    words, exact = parse_query(text)
+    if not words or not INDEX_DB_PATH:
+        return []
+    present = _present()
+    results = []
+    # Ask for extra rows in case some belong to files that have just gone
+    for path, sheet, row, col, value in cell_index.search_terms(words, exact, limit * 2):
+        if present is not None and path not in present:
+            continue
+        name = present[path] if present is not None else Path(path).name
+        results.append((name, sheet, f"{col_index_to_letters(col - 1)}{row}", format_value(value)))
+        if len(results) == limit:
+            break
+    return results
+
+def install() -> None:
+    """Index every workbook now (in the background) and follow the folder from then on."""
+    if not INDEX_DB_PATH:
+        return
+
+    def on_change(path: Path, version: FileVersion | None) -> None:
+        if version is None:
+            cell_index.schedule_forget(path)
+        else:
+            cell_index.schedule_build(path.resolve(), version)
+
+    def index_all() -> None:
+        folder_watcher.wait()
+        for path, version in folder_watcher.versions().items():
+            path = path.resolve()
+            if not cell_index.is_current(path, version):
+                cell_index.schedule_build(path, version)
+
+    folder_watcher.add_listener(on_change)
+    threading.Thread(target=index_all, name="gridbot-search-init", daemon=True).start()
@@ -14,19 +14,313 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Any
+"""Per-user conversation state, bounded by idle time (STATE_TTL_SECONDS) and count (STATE_MAX_SESSIONS).
 
-# Simple in-memory per-user state store
-_user_states: dict[int, dict[str, Any]] = {}
+Sessions hold references to the folder snapshot's file and sheet tuples rather than
+copies, so thousands of users looking at the same menu share one list. With
+STATE_DB_PATH set, sessions are also written (in the background, about once a
+second) to SQLite and read back on demand, so a restart doesn't reset conversations
+and sessions evicted from memory aren't lost. A restored session keeps its file and
+sheet listings only if the folder still matches them, so buttons sent before a
+restart never pick a different file or sheet.
+"""
+
+from __future__ import annotations
+import atexit
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from .cache import LRUCache
+from .config import STATE_DB_PATH, STATE_MAX_SESSIONS, STATE_TTL_SECONDS
+from .executor import run_blocking
+from .watcher import folder_watcher
+
+class Session:
+    """One user's place in the conversation; unused fields are None."""
+
+    __slots__ = ("step", "files", "file", "sheets", "sheet", "cell", "touched", "written")
+
+    def __init__(self, step: str) -> None:
+        self.step = step
+        self.files: tuple[Path, ...] | None = None
+        self.file: Path | None = None
+        self.sheets: tuple[str, ...] | None = None
+        self.sheet: str | None = None
+        self.cell: str | None = None
+        self.touched = time.monotonic()
+        # `touched` as last written to STATE_DB_PATH
+        self.written = 0.0
+
+# Least recently touched first
+_sessions: OrderedDict[int, Session] = OrderedDict()
+_lock = threading.Lock()
+
+# Canonical copies of sheet lists that didn't come from the folder snapshot
+_shared = LRUCache(256)
+
+def _share(values: tuple) -> tuple:
+    shared = _shared.get(values)
+    if shared is None:
+        _shared.put(values, values)
+        shared = values
+    return shared
+
+def _expire(now: float) -> None:
+    """Drop idle sessions and, past the cap, the least recently used ones (from memory only)."""
+    while _sessions:
+        user_id, session = next(iter(_sessions.items()))
+        idle = now - session.touched >= STATE_TTL_SECONDS
+        if not idle and len(_sessions) <= STATE_MAX_SESSIONS:
+            break
+        del _sessions[user_id]
+        if STATE_DB_PATH and not idle and user_id in _dirty:
+            _unflushed[user_id] = session  # written by the next flush, then forgotten
 
 def set_state(user_id: int, step: str, **kwargs) -> None:
-    st = _user_states.get(user_id, {})
-    st.update({"step": step, **kwargs})
-    _user_states[user_id] = st
+    """Move the user to `step` with only the given fields (files, file, sheets, sheet, cell) set.
+
+    Fields of the previous step are dropped, so a user back at the main menu no
+    longer pins an old folder listing.
+    """
+    now = time.monotonic()
+    session = Session(step)
+    with _lock:
+        for name, value in kwargs.items():
+            if name == "files" and value is not None:
+                value = tuple(value)
+            elif name == "sheets" and value is not None:
+                value = _share(tuple(value))
+            setattr(session, name, value)
+        session.touched = now
+        _sessions.pop(user_id, None)
+        _unflushed.pop(user_id, None)
+        _sessions[user_id] = session
+        _expire(now)
+        _mark_dirty(user_id)
+
+def _touch(user_id: int, session: Session, now: float) -> Session | None:
+    """Mark `session` used now, or drop it if it has expired (caller holds _lock)."""
+    if now - session.touched >= STATE_TTL_SECONDS:
+        _sessions.pop(user_id, None)
+        _mark_dirty(user_id, delete=True)
+        return None
+    session.touched = now
+    _sessions[user_id] = session
+    _sessions.move_to_end(user_id)
+    _expire(now)
+    # Only `touched` changed, which the database needs just for expiry: write it back now and then
+    if now - session.written >= _TOUCH_SECONDS:
+        _mark_dirty(user_id)
+    return session
+
+def _from_memory(user_id: int) -> tuple[bool, Session | None, int]:
+    """(found, session, writes): found is False when only the database can tell."""
+    with _lock:
+        session = _sessions.get(user_id) or _unflushed.pop(user_id, None)
+        if session is not None:
+            return True, _touch(user_id, session, time.monotonic()), _writes
+        with _dirty_lock:
+            cleared = bool(_dirty.get(user_id))  # cleared, not yet flushed
+        return not STATE_DB_PATH or cleared, None, _writes
+
+def _adopt(user_id: int, loaded: Session | None, writes: int) -> tuple[bool, Session | None]:
+    """Keep a session read back from the database, unless the user moved on while it was read."""
+    with _lock:
+        if writes != _writes:
+            return False, None  # a flush landed meanwhile: read again
+        session = _sessions.get(user_id) or _unflushed.pop(user_id, None)
+        with _dirty_lock:
+            if session is None and _dirty.get(user_id):
+                return True, None
+        if session is None:
+            if loaded is None:
+                return True, None
+            session = loaded
+        return True, _touch(user_id, session, time.monotonic())
 
-def get_state(user_id: int) -> dict[str, Any] | None:
-    return _user_states.get(user_id)
+def get_state(user_id: int) -> Session | None:
+    while True:
+        found, session, writes = _from_memory(user_id)
+        if found:
+            return session
+        found, session = _adopt(user_id, _load(user_id), writes)
+        if found:
+            return session
+
+async def aget_state(user_id: int) -> Session | None:
+    """get_state for handlers: a session that has to be read back from disk is read on the I/O pool."""
+    while True:
+        found, session, writes = _from_memory(user_id)
+        if found:
+            return session
+        found, session = _adopt(user_id, await run_blocking(_load, user_id), writes)
+        if found:
+            return session
 
 def clear_state(user_id: int) -> None:
-    _user_states.pop(user_id, None)
+    with _lock:
+        _sessions.pop(user_id, None)
+        _unflushed.pop(user_id, None)
+        _mark_dirty(user_id, delete=True)
+
+def session_count() -> int:
+    return len(_sessions)
+
+# ---------- Optional SQLite persistence ----------
+
+# Seconds between background writes of changed sessions
+_FLUSH_SECONDS = 1.0
+# Reads only move `touched`, written back at most this often: a restored session may expire this much early
+_TOUCH_SECONDS = 60.0
+
+_db: sqlite3.Connection | None = None
+_db_lock = threading.Lock()  # the connection; never taken while waiting for _lock
+_dirty: dict[int, bool] = {}  # user_id -> deleted?
+_unflushed: dict[int, Session] = {}  # evicted from memory before their last change was written
+_dirty_lock = threading.Lock()
+_flush_lock = threading.Lock()  # one flush at a time, so writes land in order
+_writes = 0  # flushes committed; a read racing with one is retried
+_flusher: threading.Thread | None = None
+
+# (listing, digest) by id(listing): sessions share the snapshot's tuples, so each is hashed once
+_fingerprints = LRUCache(64)
+
+def _fingerprint(values: tuple | None) -> str | None:
+    """Digest of a file or sheet listing, to tell whether a restored session's buttons still match."""
+    if values is None:
+        return None
+    entry = _fingerprints.get(id(values))
+    if entry is None or entry[0] is not values:
+        digest = hashlib.blake2b("\0".join(map(str, values)).encode(), digest_size=8).hexdigest()
+        entry = (values, digest)
+        _fingerprints.put(id(values), entry)
+    return entry[1]
+
+def _conn() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        conn = sqlite3.connect(STATE_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id INTEGER PRIMARY KEY,
+                step TEXT NOT NULL,
+                file TEXT,
+                sheet TEXT,
+                cell TEXT,
+                touched REAL NOT NULL
+            )
+        """)
+        # Fingerprints of the file and sheet listings the session's buttons were built from
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "files_key" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN files_key TEXT")
+        if "sheets_key" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN sheets_key TEXT")
+        conn.commit()
+        _db = conn
+    return _db
+
+def _load(user_id: int) -> Session | None:
+    """Read back a persisted session (blocking; not under _lock).
+
+    File and sheet listings come from the current snapshot, and only if they
+    still match the ones the session's buttons were built from; otherwise an old
+    button is an invalid selection rather than a different file or sheet.
+    """
+    if not STATE_DB_PATH:
+        return None
+    with _db_lock:
+        row = _conn().execute(
+            "SELECT step, file, sheet, cell, touched, files_key, sheets_key FROM sessions WHERE user_id=?",
+            (user_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    step, file, sheet, cell, touched, files_key, sheets_key = row
+    # Stored as wall-clock time; sessions are kept in monotonic time
+    idle = time.time() - touched
+    if idle >= STATE_TTL_SECONDS:
+        return None
+    session = Session(step)
+    session.touched = session.written = time.monotonic() - idle
+    session.file = Path(file) if file else None
+    session.sheet = sheet
+    session.cell = cell
+    snap = folder_watcher.snapshot()
+    if snap is not None:
+        if files_key is not None and _fingerprint(snap.files) == files_key:
+            session.files = snap.files
+        sheets = snap.sheets.get(session.file) if session.file is not None else None
+        if sheets_key is not None and _fingerprint(sheets) == sheets_key:
+            session.sheets = sheets
+    return session
+
+def _mark_dirty(user_id: int, delete: bool = False) -> None:
+    global _flusher
+    if not STATE_DB_PATH:
+        return
+    with _dirty_lock:
+        _dirty[user_id] = delete
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="gridbot-state", daemon=True)
+            _flusher.start()
+
+def flush() -> None:
+    """Write changed sessions now and forget expired ones on disk."""
+    global _writes
+    if not STATE_DB_PATH:
+        return
+    with _flush_lock:
+        # Collect the changes under _lock; write them without it, so handlers don't wait on the disk
+        with _lock:
+            with _dirty_lock:
+                changes = dict(_dirty)
+                _dirty.clear()
+            evicted = dict(_unflushed)
+            _unflushed.clear()
+            sessions = {}
+            for user_id, deleted in changes.items():
+                session = None if deleted else _sessions.get(user_id) or evicted.get(user_id)
+                if session is not None:
+                    session.written = session.touched
+                    sessions[user_id] = session
+            now_wall, now_mono = time.time(), time.monotonic()
+        upserts = [
+            (
+                user_id, session.step, session.file.as_posix() if session.file else None,
+                session.sheet, session.cell, now_wall - (now_mono - session.written),
+                _fingerprint(session.files), _fingerprint(session.sheets),
+            )
+            for user_id, session in sessions.items()
+        ]
+        deletes = [(uid,) for uid, deleted in changes.items() if deleted]
+        with _db_lock:
+            conn = _conn()
+            conn.executemany("DELETE FROM sessions WHERE user_id=?", deletes)
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (user_id, step, file, sheet, cell, touched, files_key, sheets_key)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                upserts,
+            )
+            conn.execute("DELETE FROM sessions WHERE touched < ?", (now_wall - STATE_TTL_SECONDS,))
+            conn.commit()
+            # Under _db_lock: a read of the old rows that finished before this is then retried
+            with _lock:
+                _writes += 1
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(_FLUSH_SECONDS)
+        try:
+            flush()
+        except sqlite3.Error:
+            pass
 
+# Don't lose the last second of changes on a clean shutdown
+atexit.register(flush)
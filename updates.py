@@ -0,0 +1,65 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+from collections import deque
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently (up to a limit) while keeping each user's updates in order.
+
+    The first update from a user runs its handlers; updates from the same user that
+    arrive meanwhile are queued behind it and run by that same task, so a user holds
+    at most one of the `max_concurrent_updates` slots and a busy user never delays
+    anyone else's turn.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        self._pending: dict[int, deque[Awaitable[Any]]] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        # Inline queries don't touch the conversation, and one arrives per keystroke: don't queue them
+        if user is None or update.inline_query is not None:
+            await coroutine
+            return
+        pending = self._pending.get(user.id)
+        if pending is not None:
+            pending.append(coroutine)
+            return
+        pending = self._pending[user.id] = deque([coroutine])
+        try:
+            while pending:
+                try:
+                    await pending.popleft()
+                except Exception:  # noqa: BLE001
+                    # Application.process_update has already sent it to the error handlers
+                    continue
+        finally:
+            del self._pending[user.id]
+            # Only left over when cancelled during shutdown
+            for leftover in pending:
+                getattr(leftover, "close", lambda: None)()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,256 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from .cache import FileVersion, file_version
+from .config import EXCEL_FOLDER, FOLDER_POLL_SECONDS
+from .excel import is_excel_name, list_excel_files, sort_files
+from . import xlsx_stream
+
+# inotify(7) constants
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# Writers emit bursts of events; wait this long for quiet before re-reading a file
+_DEBOUNCE_SECONDS = 0.5
+
+def _inotify_open(folder: Path) -> int | None:
+    """Return an inotify fd watching `folder`, or None where inotify isn't available."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(folder), _WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+def _read_sheet_names(path: Path) -> tuple[str, ...] | None:
+    """Sheet names without parsing any sheet; None if the file can't be read right now."""
+    try:
+        if path.suffix.lower() == ".xlsx":
+            return tuple(xlsx_stream.sheet_names(path))
+        import xlrd
+        wb = xlrd.open_workbook(path.as_posix(), on_demand=True)
+        try:
+            return tuple(wb.sheet_names())
+        finally:
+            wb.release_resources()
+    except Exception:  # noqa: BLE001
+        return None
+
+class FolderSnapshot:
+    """Immutable view of the watched folder; `version` increases with every change."""
+
+    __slots__ = ("version", "files", "sheets")
+
+    def __init__(self, version: int, files: tuple[Path, ...], sheets: dict[Path, tuple[str, ...]]) -> None:
+        self.version = version
+        self.files = files
+        self.sheets = sheets
+
+class FolderWatcher:
+    """Keep the sorted Excel file list and each file's sheet names current in memory.
+
+    One full scan at start, then a rescan every FOLDER_POLL_SECONDS. inotify, where
+    available, reports local changes in between; it can't replace the rescans, since
+    on network mounts (NFS, SMB) it never sees changes made from other machines.
+    After the initial scan, listeners are called with (path, version) from the
+    watcher thread whenever a file appears, changes or disappears (version None).
+    """
+
+    def __init__(self, folder: Path, poll_seconds: float = FOLDER_POLL_SECONDS) -> None:
+        self.folder = folder
+        self.poll_seconds = poll_seconds
+        self._versions: dict[Path, FileVersion] = {}
+        self._sheets: dict[Path, tuple[str, ...]] = {}
+        self._snapshot: FolderSnapshot | None = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[Path, FileVersion | None], None]] = []
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gridbot-watcher", daemon=True)
+            self._thread.start()
+
+    def add_listener(self, callback: Callable[[Path, FileVersion | None], None]) -> None:
+        self._listeners.append(callback)
+
+    def snapshot(self) -> FolderSnapshot | None:
+        """Current snapshot, or None until the first scan has finished."""
+        return self._snapshot
+
+    def wait(self, timeout: float | None = None) -> FolderSnapshot | None:
+        """Block until the first scan is done (starting the watcher if needed)."""
+        self.start()
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def versions(self) -> dict[Path, FileVersion]:
+        with self._lock:
+            return dict(self._versions)
+
+    # ---------- internals ----------
+
+    def _publish(self) -> None:
+        with self._lock:
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            self._snapshot = FolderSnapshot(version, tuple(sort_files(self._versions)), dict(self._sheets))
+        self._ready.set()
+
+    def _notify(self, path: Path, version: FileVersion | None) -> None:
+        for cb in list(self._listeners):
+            try:
+                cb(path, version)
+            except Exception:  # noqa: BLE001
+                pass
+
+    def _apply(self, changes: dict[Path, FileVersion | None], notify: bool = True) -> None:
+        """Record new versions, refresh sheet names of changed files, publish, then notify."""
+        if not changes:
+            return
+        with self._lock:
+            for path, version in changes.items():
+                if version is None:
+                    self._versions.pop(path, None)
+                    self._sheets.pop(path, None)
+                else:
+                    self._versions[path] = version
+        # Publish the file list first; sheet names can take a moment on big folders
+        self._publish()
+        for path, version in changes.items():
+            if version is not None:
+                names = _read_sheet_names(path)
+                with self._lock:
+                    if names is None:
+                        self._sheets.pop(path, None)
+                    else:
+                        self._sheets[path] = names
+        self._publish()
+        if notify:
+            for path, version in changes.items():
+                self._notify(path, version)
+
+    def _full_scan(self) -> None:
+        current: dict[Path, FileVersion] = {}
+        for path in list_excel_files(self.folder):
+            try:
+                current[path] = file_version(path)
+            except OSError:
+                continue
+        with self._lock:
+            known = dict(self._versions)
+        changes: dict[Path, FileVersion | None] = {
+            p: v for p, v in current.items() if known.get(p) != v
+        }
+        changes.update({p: None for p in known if p not in current})
+        # The first scan only establishes the baseline; nothing has "changed" yet
+        self._apply(changes, notify=self._ready.is_set())
+        self._ready.set()
+
+    def _refresh(self, names: set[str]) -> None:
+        changes: dict[Path, FileVersion | None] = {}
+        for name in names:
+            if not is_excel_name(name):
+                continue
+            path = self.folder / name
+            try:
+                version = file_version(path) if path.is_file() else None
+            except OSError:
+                version = None
+            with self._lock:
+                known = self._versions.get(path)
+            if version != known:
+                changes[path] = version
+        self._apply(changes)
+
+    def _run(self) -> None:
+        # Watch before scanning so nothing changing during the scan is missed
+        fd = _inotify_open(self.folder) if self.folder.exists() else None
+        self._full_scan()
+        pending: set[str] = set()
+        last_full = time.monotonic()
+        while True:
+            if fd is None:
+                time.sleep(self.poll_seconds)
+                fd = _inotify_open(self.folder) if self.folder.exists() else None
+                self._full_scan()
+                continue
+            # Rescan on schedule even while events keep arriving; it only stats the files
+            until_full = last_full + self.poll_seconds - time.monotonic()
+            if until_full <= 0:
+                self._full_scan()
+                last_full = time.monotonic()
+                continue
+            timeout = min(_DEBOUNCE_SECONDS, until_full) if pending else until_full
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                if pending:
+                    self._refresh(pending)
+                    pending.clear()
+                continue
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                _wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b"\0")
+                offset += _EVENT.size + length
+                if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                    # The folder itself went away: poll until it is back
+                    os.close(fd)
+                    fd = None
+                    break
+                if mask & _IN_Q_OVERFLOW:
+                    pending.clear()
+                    self._full_scan()
+                    last_full = time.monotonic()
+                elif name:
+                    pending.add(os.fsdecode(name))
+
+# Shared watcher for EXCEL_FOLDER; main() starts it
+folder_watcher = FolderWatcher(EXCEL_FOLDER)
@@ -0,0 +1,116 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Worker processes for CPU-bound spreadsheet work (WORKER_PROCESSES > 0).
+
+openpyxl parsing and xlcalculator evaluation hold the GIL, so threads alone keep
+the bot on one core. Each worker is a one-process pool; a file always goes to
+the same worker, so that worker's workbook, model and result caches stay hot for
+it. Jobs send back only their (already formatted) results. A worker that dies
+is replaced and the job retried once; one that passes WORKER_MAX_RSS_MB is
+replaced after its current work, which releases everything it had cached.
+"""
+
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+import signal
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable
+
+from .config import WARM_IMPORTS, WORKER_MAX_RSS_MB, WORKER_PROCESSES
+from .excel import import_libraries
+from . import metrics
+
+# Fresh interpreters: forking would copy the parent's threads, locks and SQLite connections
+_context = multiprocessing.get_context("spawn")
+
+def _rss_bytes() -> int:
+    """Current resident memory of this process (peak, where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _init() -> None:
+    # Ctrl-C is for the main process, which shuts the workers down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from . import cell_index
+    cell_index.disable_builds()
+
+def _call(fn: Callable[..., Any], args: tuple) -> tuple[Any, int]:
+    return fn(*args), _rss_bytes()
+
+class _Worker:
+    def __init__(self) -> None:
+        self.pool = self._spawn()
+
+    @staticmethod
+    def _spawn() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, mp_context=_context, initializer=_init)
+
+    def replace(self, pool: ProcessPoolExecutor) -> None:
+        """Swap in a fresh process unless `pool` was already replaced; queued jobs still finish on the old one."""
+        if self.pool is pool:
+            self.pool = self._spawn()
+            pool.shutdown(wait=False)
+
+_workers: list[_Worker] = []
+
+def enabled() -> bool:
+    return WORKER_PROCESSES > 0
+
+def start() -> None:
+    """Start the workers now (otherwise on first use), so their imports don't delay the first lookup."""
+    if not enabled() or _workers:
+        return
+    _workers.extend(_Worker() for _ in range(WORKER_PROCESSES))
+    for worker in _workers:
+        worker.pool.submit(import_libraries if WARM_IMPORTS else _rss_bytes)
+
+def stop() -> None:
+    for worker in _workers:
+        worker.pool.shutdown(wait=True, cancel_futures=True)
+    _workers.clear()
+
+def _worker_for(file_path: Path) -> _Worker:
+    start()
+    return _workers[zlib.crc32(file_path.as_posix().encode()) % len(_workers)]
+
+async def submit(file_path: Path, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` (a module-level function) in the worker that owns `file_path`."""
+    worker = _worker_for(file_path)
+    with metrics.timer(f"worker.{fn.__name__}"):
+        for attempt in range(2):
+            # Only ever replaced from the event loop, so no lock between reading and submitting
+            pool = worker.pool
+            try:
+                result, rss = await asyncio.wrap_future(pool.submit(_call, fn, args))
+            except BrokenProcessPool:
+                # The process died (crash, OOM kill): the job may simply be too big, so retry only once
+                worker.replace(pool)
+                if attempt:
+                    raise
+                continue
+            if WORKER_MAX_RSS_MB and rss > WORKER_MAX_RSS_MB * 1024 * 1024:
+                worker.replace(pool)
+            return result
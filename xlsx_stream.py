@@ -0,0 +1,319 @@
+# gridbot - A Telegram bot for spreadsheet lookups
+# Copyright (C) 2025  Thomas La Mendola
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Lean single-cell reader for .xlsx: stream the sheet XML and stop at the target row.
+
+Anything this module can't answer exactly like openpyxl would (formulas without a
+cached value, date-formatted numbers, unusual packages) returns MISS so the caller
+falls back to openpyxl.
+"""
+
+from __future__ import annotations
+import posixpath
+import re
+import threading
+import zipfile
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+from xml.etree.ElementTree import iterparse, parse
+
+from .cache import LRUCache, file_version
+from . import metrics
+
+MISS = object()
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_OFFICE_DOC = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+_SHARED_STRINGS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+_STYLES = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+
+_COORD_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+def _rels_path(part: str) -> str:
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", f"{name}.rels")
+
+def _resolve(base_part: str, target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+class _Package:
+    """Per-version metadata for one .xlsx: sheet parts, lazily parsed shared strings and date styles."""
+
+    def __init__(self, path: Path) -> None:
+        self.zip = zipfile.ZipFile(path)
+        self.lock = threading.Lock()
+        root_rels = parse(self.zip.open("_rels/.rels")).getroot()
+        wb_part = next(
+            _resolve("", r.get("Target", ""))
+            for r in root_rels.iter(f"{_NS_PKG_REL}Relationship")
+            if r.get("Type") == _OFFICE_DOC
+        )
+        rels = {
+            r.get("Id"): (r.get("Type"), _resolve(wb_part, r.get("Target", "")))
+            for r in parse(self.zip.open(_rels_path(wb_part))).getroot().iter(f"{_NS_PKG_REL}Relationship")
+        }
+        self.sheet_parts: dict[str, str] = {}
+        wb_root = parse(self.zip.open(wb_part)).getroot()
+        sheet_order: list[str] = []
+        for sh in wb_root.iter(f"{_NS_MAIN}sheet"):
+            sheet_order.append(sh.get("name"))
+            rel = rels.get(sh.get(f"{_NS_REL}id"))
+            if rel:
+                self.sheet_parts[sh.get("name")] = rel[1]
+        # Defined names as {(scope sheet or None, lower-case name): reference}
+        self.defined_names: dict[tuple[str | None, str], str] = {}
+        for dn in wb_root.iter(f"{_NS_MAIN}definedName"):
+            local = dn.get("localSheetId")
+            scope = sheet_order[int(local)] if local is not None and int(local) < len(sheet_order) else None
+            if dn.text:
+                self.defined_names[(scope, dn.get("name", "").lower())] = dn.text
+        by_type = {t: target for t, target in rels.values()}
+        self._strings_part = by_type.get(_SHARED_STRINGS)
+        self._styles_part = by_type.get(_STYLES)
+        self._strings: list[str] = []
+        self._strings_iter: Iterator | None = None
+        self._date_styles: frozenset[int] | None = None
+
+    def shared_string(self, idx: int) -> str:
+        """Parse sharedStrings.xml only as far as `idx`, remembering what was read."""
+        with self.lock:
+            if self._strings_iter is None and self._strings_part:
+                self._strings_iter = iterparse(self.zip.open(self._strings_part), events=("end",))
+            while len(self._strings) <= idx and self._strings_iter is not None:
+                try:
+                    _event, el = next(self._strings_iter)
+                except StopIteration:
+                    self._strings_iter = None
+                    break
+                if el.tag == f"{_NS_MAIN}si":
+                    # Plain text or rich text runs; phonetic hints (rPh) are skipped like openpyxl does
+                    parts: list[str] = []
+                    for child in el:
+                        if child.tag == f"{_NS_MAIN}r":
+                            child = child.find(f"{_NS_MAIN}t")
+                        if child is not None and child.tag == f"{_NS_MAIN}t":
+                            parts.append(child.text or "")
+                    self._strings.append("".join(parts))
+                    el.clear()
+            return self._strings[idx]
+
+    def date_styles(self) -> frozenset[int]:
+        """Indices into cellXfs whose number format displays as a date/time."""
+        with self.lock:
+            if self._date_styles is None:
+                self._date_styles = self._load_date_styles()
+            return self._date_styles
+
+    def _load_date_styles(self) -> frozenset[int]:
+        from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+        if not self._styles_part:
+            return frozenset()
+        root = parse(self.zip.open(self._styles_part)).getroot()
+        custom = {
+            int(nf.get("numFmtId")): nf.get("formatCode", "")
+            for nf in root.iter(f"{_NS_MAIN}numFmt")
+        }
+        xfs = root.find(f"{_NS_MAIN}cellXfs")
+        dates: set[int] = set()
+        for i, xf in enumerate(xfs if xfs is not None else ()):
+            fmt_id = int(xf.get("numFmtId", "0"))
+            fmt = custom.get(fmt_id, BUILTIN_FORMATS.get(fmt_id, "General"))
+            if is_date_format(fmt):
+                dates.add(i)
+        return frozenset(dates)
+
+# Keyed by (resolved path, mtime_ns, size); packages are small, the count is what matters
+_packages = LRUCache(16)
+metrics.register_cache("xlsx_packages", _packages)
+
+def _package(file_path: Path) -> _Package:
+    path = file_path.resolve()
+    key = (path, *file_version(path))
+    pkg = _packages.get(key)
+    if pkg is None:
+        _packages.discard_where(lambda k: k[0] == path)
+        pkg = _Package(path)
+        _packages.put(key, pkg)
+    return pkg
+
+def sheet_names(file_path: Path) -> list[str]:
+    """Sheet names in workbook order, read from workbook.xml only."""
+    return list(_package(file_path).sheet_parts)
+
+def defined_names(file_path: Path) -> dict[tuple[str | None, str], str]:
+    """Defined names as {(scope sheet or None for global, lower-case name): reference}."""
+    return _package(file_path).defined_names
+
+def _cast_number(text: str) -> int | float:
+    if "." in text or "E" in text or "e" in text:
+        return float(text)
+    return int(text)
+
+def _cell_value(pkg: _Package, c, raw: bool = False) -> Any:
+    """Decode a <c> element. With `raw`, dates stay serial numbers and uncached formulas are None."""
+    ctype = c.get("t", "n")
+    v = c.find(f"{_NS_MAIN}v")
+    if ctype == "inlineStr":
+        is_ = c.find(f"{_NS_MAIN}is")
+        return "".join(t.text or "" for t in is_.iter(f"{_NS_MAIN}t")) if is_ is not None else None
+    if v is None or v.text is None:
+        # Formula without a cached result, or an empty styled cell
+        return MISS if not raw and c.find(f"{_NS_MAIN}f") is not None else None
+    text = v.text
+    if ctype == "s":
+        return pkg.shared_string(int(text))
+    if ctype in ("str", "e"):
+        return text
+    if ctype == "b":
+        return bool(int(text))
+    if ctype == "n":
+        style = c.get("s")
+        if not raw and style is not None and int(style) in pkg.date_styles():
+            return MISS  # let openpyxl convert to datetime
+        return _cast_number(text)
+    return text if raw else MISS  # t="d" and anything unexpected
+
+def read_value(file_path: Path, sheet_name: str, cell_coord: str) -> Any:
+    """Return the cached value of one cell, None if it is empty, or MISS if openpyxl should decide."""
+    return read_values(file_path, sheet_name, [cell_coord])[cell_coord]
+
+def read_values(file_path: Path, sheet_name: str, coords: Iterable[str]) -> dict[str, Any]:
+    """Read several cells of one sheet in a single pass that stops after the last target row.
+
+    Returns {coord: value} with None for empty cells and MISS where openpyxl should decide.
+    """
+    targets: dict[str, list[str]] = {}  # normalised coord -> coords as given
+    result: dict[str, Any] = {}
+    for coord in coords:
+        result[coord] = MISS
+        m = _COORD_RE.match(coord.upper())
+        if m:
+            targets.setdefault(m.group(0), []).append(coord)
+    if not targets:
+        return result
+    last_row = max(int(_COORD_RE.match(c).group(2)) for c in targets)
+    try:
+        pkg = _package(file_path)
+    except (KeyError, StopIteration, zipfile.BadZipFile):
+        return result
+    part = pkg.sheet_parts.get(sheet_name)
+    if part is None:
+        return result
+    remaining = set(targets)
+    complete = True  # False if the sheet can't be addressed by r attributes
+    with pkg.zip.open(part) as fh:
+        sheet_data = None
+        for event, el in iterparse(fh, events=("start", "end")):
+            if event == "start":
+                if el.tag == f"{_NS_MAIN}sheetData":
+                    sheet_data = el
+                elif el.tag == f"{_NS_MAIN}row":
+                    r = el.get("r")
+                    if r is None:
+                        complete = False  # rows without numbers would need counting like openpyxl does
+                        break
+                    if int(r) > last_row:
+                        break  # passed every target row
+                continue
+            if el.tag == f"{_NS_MAIN}c":
+                r = el.get("r")
+                if r is None:
+                    complete = False
+                    break
+                if r in remaining:
+                    value = _cell_value(pkg, el)
+                    for coord in targets[r]:
+                        result[coord] = value
+                    remaining.discard(r)
+            elif el.tag == f"{_NS_MAIN}row":
+                sheet_data.clear()  # finished rows are never needed again
+                if not remaining:
+                    break
+    if complete:
+        # Targets never seen in a fully read range are empty cells
+        for norm in remaining:
+            for coord in targets[norm]:
+                result[coord] = None
+    return result
+
+def _col_index(letters: str) -> int:
+    total = 0
+    for ch in letters:
+        total = total * 26 + (ord(ch) - 64)
+    return total
+
+def _iter_cell_elements(pkg: _Package, part: str) -> Iterator[tuple[int, int, Any]]:
+    """Yield (row, col, <c> element) for a sheet part, 1-based, freeing each row once done."""
+    with pkg.zip.open(part) as fh:
+        sheet_data = None
+        row = col = 0
+        for event, el in iterparse(fh, events=("start", "end")):
+            if event == "start":
+                if el.tag == f"{_NS_MAIN}sheetData":
+                    sheet_data = el
+                elif el.tag == f"{_NS_MAIN}row":
+                    # r is optional; missing numbers continue from the previous row/cell
+                    r = el.get("r")
+                    row = int(r) if r is not None else row + 1
+                    col = 0
+                continue
+            if el.tag == f"{_NS_MAIN}c":
+                m = _COORD_RE.match(el.get("r") or "")
+                col = _col_index(m.group(1)) if m else col + 1
+                yield row, col, el
+            elif el.tag == f"{_NS_MAIN}row":
+                sheet_data.clear()
+
+def iter_cells(file_path: Path, sheet_name: str) -> Iterator[tuple[int, int, Any]]:
+    """Yield (row, col, value) for every non-empty cell of a sheet, 1-based, in file order.
+
+    Values are MISS where openpyxl would have to decide (uncached formulas, dates).
+    Raises KeyError for an unknown sheet.
+    """
+    pkg = _package(file_path)
+    for row, col, el in _iter_cell_elements(pkg, pkg.sheet_parts[sheet_name]):
+        value = _cell_value(pkg, el)
+        if value is not None:
+            yield row, col, value
+
+def iter_formula_cells(file_path: Path, sheet_name: str) -> Iterator[tuple[str, str | None, Any]]:
+    """Yield (coord, formula, value) for every cell, with shared formulas expanded.
+
+    Formulas are returned with their leading "="; values are raw, i.e. dates stay
+    serial numbers, as a formula engine expects. Raises KeyError for an unknown sheet.
+    """
+    from openpyxl.formula.translate import Translator
+    from openpyxl.utils.cell import get_column_letter
+    pkg = _package(file_path)
+    shared: dict[str, Translator] = {}
+    for row, col, el in _iter_cell_elements(pkg, pkg.sheet_parts[sheet_name]):
+        coord = f"{get_column_letter(col)}{row}"
+        formula = None
+        f = el.find(f"{_NS_MAIN}f")
+        if f is not None:
+            if f.text:
+                formula = f"={f.text}"
+                if f.get("t") == "shared" and f.get("si") is not None:
+                    shared[f.get("si")] = Translator(formula, origin=coord)
+            elif f.get("t") == "shared" and f.get("si") in shared:
+                formula = shared[f.get("si")].translate_formula(coord)
+        value = _cell_value(pkg, el, raw=True)
+        if formula is not None or value is not None:
+            yield coord, formula, value